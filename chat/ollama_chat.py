@@ -1,40 +1,28 @@
-import requests
-import logging
-from config import OLLAMA_API_URL
+from python_Script.conversation_memory import ConversationMemory
+from python_Script.ollama_client import ollama_client
 
 class OllamaChat:
     def __init__(self, model, system_instruction=""):
         self.model = model
         self.system = system_instruction
-        self.history = []
+        # Bounded like the app's chat: recent turns verbatim, older ones folded into a summary
+        self.memory = ConversationMemory()
+
+    @property
+    def history(self):
+        return self.memory.history
 
     def start_chat(self, history=None):
-        self.history = history or []
+        self.memory = ConversationMemory(history=history)
         return self
 
     def send_message(self, message):
-        messages = []
-        if self.system:
-            messages.append({"role": "system", "content": self.system})
-        for entry in self.history:
-            messages.append({"role": entry["role"], "content": entry["content"]})
-        messages.append({"role": "user", "content": message})
-
-        response = requests.post(
-            f"{OLLAMA_API_URL}/chat",
-            json={"model": self.model, "messages": messages, "stream": False}
-        )
-
-        if response.status_code != 200:
-            logging.error(f"Ollama API error: {response.text}")
-            raise Exception(f"Ollama API returned status {response.status_code}")
-
-        content = response.json()["message"]["content"]
-        self.history.append({"role": "user", "content": message})
-        self.history.append({"role": "assistant", "content": content})
+        messages = self.memory.build(self.system, message)
+        content = ollama_client.chat({"model": self.model, "messages": messages})["message"]["content"]
+        self.memory.add(message, content)
 
         class ResponseObj:
             def __init__(self, text):
                 self.text = text
 
-        return ResponseObj(content)
\ No newline at end of file
+        return ResponseObj(content)
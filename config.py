@@ -3,8 +3,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+# Ollama servers (OLLAMA_API_URL) and models (OLLAMA_MODEL, <TASK>_MODEL) are read in one place:
+# python_Script/ollama_client.py and python_Script/model_routing.py
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 HF_API_KEY = os.getenv("HF_API_KEY")
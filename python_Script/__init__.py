@@ -0,0 +1,7 @@
+"""Health assistant backend.
+
+The app runs from this folder (python app.py) and imports its modules as
+top-level modules. The root tree imports the shared LLM client and chat
+memory from it as a package (python_Script.ollama_client,
+python_Script.conversation_memory).
+"""
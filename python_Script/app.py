@@ -1,4 +1,16 @@
-from waitress import serve
-from ollamatry import app  # make sure `ollamatry.py` has a Flask `app` object
+import os
 
-serve(app, host='0.0.0.0', port=4000)
+# "wsgi" serves the Flask app on waitress threads; "asgi" serves asgi_app on an asyncio event loop,
+# where each streaming chat response holds a coroutine rather than a thread
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+if SERVER_MODE == "asgi":
+    import uvicorn
+    from asgi_app import asgi_app
+
+    uvicorn.run(asgi_app, host='0.0.0.0', port=4000)
+else:
+    from waitress import serve
+    from ollamatry import app  # make sure `ollamatry.py` has a Flask `app` object
+
+    serve(app, host='0.0.0.0', port=4000)
@@ -0,0 +1,226 @@
+import json
+import asyncio
+import logging
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from json_stream import JSONObjectStream
+from ollamatry import (app, sessions, auth_error, start_conversation, build_chat_prompt, upload_error,
+                       prepare_file_analysis, record_upload, insight_prompt, insight_request, parse_insights,
+                       generate_fallback_insights, conversation_summary, record_exchange, insight_cache,
+                       INSIGHTS_MODE, INSIGHTS_STATELESS)
+from ingest_queue import IngestQueueFull
+from ollama_client import OllamaError
+from llm_scheduler import LLMOverloaded, PRIORITY_INTERACTIVE, PRIORITY_DOCUMENT, PRIORITY_INSIGHT
+from async_ollama_client import async_ollama_client
+
+# asyncio serving mode (python app.py with SERVER_MODE=asgi).
+#
+# The two streaming endpoints run natively on the event loop and stream from
+# Ollama with the async client, so a slow generation holds a coroutine
+# instead of a server thread. Blocking steps (RAG retrieval, waiting for text
+# extraction) run in the thread pool. Every other route is the unchanged
+# Flask app, mounted as WSGI.
+
+
+def require_auth(f):
+    @wraps(f)
+    async def decorated(request):
+        error = auth_error(request.headers.get('Authorization'))
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        return await f(request)
+    return decorated
+
+
+async def request_insights(payload):
+    """Async request_insights: stops the stream once the JSON object is complete"""
+    parser = JSONObjectStream()
+    stream = async_ollama_client.stream_chat(payload, priority=PRIORITY_INSIGHT)
+    try:
+        async for chunk in stream:
+            if parser.feed(chunk.get("message", {}).get("content", "")):
+                break
+    finally:
+        await stream.aclose()
+    return parse_insights(parser.text)
+
+
+async def generate_insights(insight_chat, summary, language):
+    """Async generate_insights: same prompt, parsing and fallback"""
+    prompt = insight_prompt(summary, language)
+    try:
+        if not INSIGHTS_STATELESS:
+            result = await async_ollama_client.chat(
+                insight_chat.payload(insight_chat.build_messages(prompt), language=language), priority=PRIORITY_INSIGHT)
+            response_text = result["message"]["content"]
+            insight_chat.record(prompt, response_text)
+            return parse_insights(response_text) or generate_fallback_insights()
+
+        payload, key = insight_request(insight_chat, prompt, language)
+        insights = insight_cache.get(key)
+        if insights is None:
+            insights = await request_insights(payload)
+            if insights is None:
+                return generate_fallback_insights()
+            insight_cache.put(key, insights)
+        return insights
+    except Exception as e:
+        logging.error(f"Error generating insights: {str(e)}")
+        return generate_fallback_insights()
+
+
+def start_insights(session_data, prompt, language):
+    """Async start_insights: a task running alongside the answer stream"""
+    if INSIGHTS_MODE == "detached":
+        return None
+    summary = conversation_summary(session_data, prompt)
+    return asyncio.create_task(generate_insights(session_data['insight_chat'], summary, language))
+
+
+async def finish_insights(session_data, task, language):
+    """Async finish_insights. A detached task is exposed as a concurrent Future,
+    which the Flask /insights route waits on from its worker thread"""
+    if task is not None:
+        return {"insights": await task}
+    future = Future()
+    task = asyncio.create_task(generate_insights(session_data['insight_chat'], conversation_summary(session_data), language))
+    task.add_done_callback(
+        lambda task: future.set_result(generate_fallback_insights() if task.cancelled() else task.result()))
+    session_data['insights'] = future
+    return {"insights": None, "insights_pending": True}
+
+
+async def stream_answer(session_data, prompt, language, insights, slot, task="chat", **final):
+    """NDJSON body shared by both streaming routes, in the same format as the Flask app"""
+    chat = session_data['chat']
+    full_response = ""
+    try:
+        messages = chat.build_messages(prompt)
+        async for chunk in async_ollama_client.stream_chat(chat.payload(messages, task), slot=slot):
+            if "message" in chunk and "content" in chunk["message"]:
+                content = chunk["message"]["content"]
+                full_response += content
+                yield json.dumps({"chunk": content, "done": False}) + "\n"
+    except OllamaError as e:
+        logging.error(f"Streaming response failed from model API: {e}")
+        yield json.dumps({'error': 'Streaming failed from model API.'}) + "\n"
+        return
+
+    record_exchange(session_data, chat, prompt, full_response)
+    yield json.dumps({
+        "chunk": "",
+        "done": True,
+        **(await finish_insights(session_data, insights, language)),
+        "is_first_message": False,
+        **final
+    }) + "\n"
+
+
+@require_auth
+async def process_request(request):
+    """Async /chat/<session_id>"""
+    session_id = request.path_params['session_id']
+    if session_id not in sessions:
+        return JSONResponse({'error': 'Invalid session ID.'}, status_code=400)
+
+    session_data = sessions[session_id]
+    data = await request.json()
+    user_message = data.get('user_message', '').strip()
+    language = data.get('language', 'English')
+    user_email = data.get('email', '')
+
+    if not user_message:
+        return JSONResponse(start_conversation(session_data))
+
+    enhanced_message = await run_in_threadpool(build_chat_prompt, user_message, user_email)
+    try:
+        slot = await async_ollama_client.admit(PRIORITY_INTERACTIVE, affinity=session_id)
+    except LLMOverloaded as e:
+        return JSONResponse({'error': str(e)}, status_code=e.status)
+
+    # From here until the response owns the slot, any error must give it back
+    try:
+        session_data['chat_history'].append({'role': 'user', 'message': user_message})
+        insights = start_insights(session_data, enhanced_message, language)
+        # The background task frees the slot if the stream never ran
+        return StreamingResponse(stream_answer(session_data, enhanced_message, language, insights, slot),
+                                 media_type='application/json', background=BackgroundTask(slot.release))
+    except Exception:
+        slot.release()
+        raise
+
+
+@require_auth
+async def process_file(request):
+    """Async /process_file/<session_id>"""
+    session_id = request.path_params['session_id']
+    form = await request.form()
+    file = form.get('file')
+    language = form.get('language', 'english')
+    username = form.get('user')
+
+    # A plain form field named "file" is no upload, as for Flask's request.files
+    error = upload_error(session_id, file.filename if isinstance(file, UploadFile) else None, username)
+    if error:
+        return JSONResponse(error[0], status_code=error[1])
+
+    try:
+        content = await file.read()
+        job_id, summary_prompt, error = await run_in_threadpool(
+            prepare_file_analysis, file.filename, content, username)
+        if error:
+            return JSONResponse(error[0], status_code=error[1])
+        slot = await async_ollama_client.admit(PRIORITY_DOCUMENT, affinity=session_id)
+        # From here until the response owns the slot, any error must give it back
+        try:
+            session_data = sessions[session_id]
+            record_upload(session_data, file.filename)
+            insights = start_insights(session_data, summary_prompt, language)
+            return StreamingResponse(
+                stream_answer(session_data, summary_prompt, language, insights, slot, task="document",
+                              file_processed=True, job_id=job_id),
+                media_type='application/json', background=BackgroundTask(slot.release))
+        except Exception:
+            slot.release()
+            raise
+
+    except LLMOverloaded as e:
+        logging.error(f"Error processing file: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=e.status)
+    except IngestQueueFull as e:
+        logging.error(f"Error processing file: {str(e)}")
+        return JSONResponse({'error': 'Too many files are being processed, please retry shortly.'}, status_code=503)
+    except Exception as e:
+        logging.error(f"Error processing file: {str(e)}")
+        return JSONResponse({'error': f'Failed to process file: {str(e)}'}, status_code=500)
+
+
+@asynccontextmanager
+async def lifespan(starlette_app):
+    yield
+    await async_ollama_client.aclose()
+
+
+asgi_app = Starlette(
+    routes=[
+        Route('/chat/{session_id}', process_request, methods=['POST']),
+        Route('/process_file/{session_id}', process_file, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(app)),
+    ],
+    # Matches CORS(app, supports_credentials=True) on the Flask app
+    middleware=[Middleware(CORSMiddleware, allow_origin_regex='.*', allow_credentials=True,
+                           allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
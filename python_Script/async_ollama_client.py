@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+
+import httpx
+
+from model_residency import model_stats, with_residency
+from llm_scheduler import LLMOverloaded, PRIORITY_INTERACTIVE
+from ollama_client import (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_MAX_RETRIES, OLLAMA_RETRY_BACKOFF,
+                           RETRY_STATUSES, OllamaError, OllamaUnavailable, ollama_client)
+
+# Connections the event loop keeps open to Ollama. Streams beyond this wait for a free
+# connection (up to the read timeout); Ollama itself only runs OLLAMA_NUM_PARALLEL at once
+OLLAMA_ASYNC_POOL_SIZE = int(os.getenv("OLLAMA_ASYNC_POOL_SIZE", "64"))
+
+
+class AsyncOllamaClient:
+    """asyncio counterpart of OllamaClient for the ASGI server.
+
+    Same timeouts, retry and failover policy, and the same backend pool
+    (circuit breakers, schedulers, health) as the threaded client, since both
+    talk to the same servers. A waiting stream (or a call queued for a slot)
+    costs a coroutine rather than a thread.
+    """
+    def __init__(self, pool=ollama_client.pool, pool_size=OLLAMA_ASYNC_POOL_SIZE, max_retries=OLLAMA_MAX_RETRIES):
+        self.pool = pool
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        self.retries = 0
+
+    async def _failover(self, tried, slot):
+        """OllamaClient._failover, waiting for the slot on the event loop"""
+        backend = self.pool.pick(exclude=tried)
+        if backend is None or not backend.available():
+            return None
+        if slot is not None:
+            try:
+                await slot.transfer_async(backend.scheduler)
+            except LLMOverloaded:
+                return None
+        tried[-1].failovers += 1
+        logging.warning(f"Ollama call failing over from {tried[-1].base_url} to {backend.base_url}")
+        return backend
+
+    async def request(self, method, path, idempotent=True, slot=None, **kwargs):
+        """Send a request and return the (unread) response once its headers arrive with status 200.
+
+        Backend choice, retries and failover follow OllamaClient.request:
+        idempotent calls only, on connection errors, connect timeouts and
+        502/503/504.
+        """
+        attempts = self.max_retries + 1 if idempotent else 1
+        backend = slot.backend if slot is not None else self.pool.pick()
+        tried = [backend]
+        for attempt in range(attempts):
+            if not backend.breaker.allow():
+                raise OllamaUnavailable(f"Ollama at {backend.base_url} is unavailable, please retry shortly")
+            retryable = False
+            try:
+                request = self.client.build_request(method, f"{backend.base_url}{path}", **kwargs)
+                response = await self.client.send(request, stream=True)
+            except httpx.HTTPError as e:
+                backend.breaker.record_failure()
+                retryable = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                error = OllamaError(f"Ollama request to {backend.base_url}{path} failed: {e!r}")
+            else:
+                if response.status_code == 200:
+                    backend.breaker.record_success()
+                    return response
+                if response.status_code >= 500:
+                    backend.breaker.record_failure()
+                else:
+                    backend.breaker.record_success()
+                retryable = response.status_code in RETRY_STATUSES
+                await response.aread()
+                logging.error(f"Ollama API error: {response.text}")
+                await response.aclose()
+                error = OllamaError(f"Ollama API returned status {response.status_code}")
+            if not retryable or attempt == attempts - 1:
+                raise error
+            self.retries += 1
+            failover = await self._failover(tried, slot)
+            if failover is not None:
+                backend = failover
+                tried.append(backend)
+            else:
+                await asyncio.sleep(random.uniform(0, OLLAMA_RETRY_BACKOFF * 2 ** attempt))
+
+    async def admit(self, priority, affinity=None):
+        """Take a scheduler slot for a model call on the backend chosen for it; raises LLMOverloaded
+        when the call is shed"""
+        return await self.pool.admit_async(priority, affinity)
+
+    async def chat(self, payload, priority=PRIORITY_INTERACTIVE, affinity=None):
+        """Non-streaming /chat call; returns the decoded response"""
+        with await self.admit(priority, affinity) as slot:
+            response = await self.request("POST", "/chat", slot=slot,
+                                          json=with_residency({**payload, "stream": False}))
+            try:
+                await response.aread()
+                result = response.json()
+            except httpx.HTTPError as e:
+                slot.backend.breaker.record_failure()
+                raise OllamaError(f"Ollama response interrupted: {e!r}")
+            except ValueError as e:
+                raise OllamaError(f"Invalid response from Ollama: {e}")
+            finally:
+                await response.aclose()
+        model_stats.record(payload.get("model"), result)
+        return result
+
+    async def stream_chat(self, payload, priority=PRIORITY_INTERACTIVE, slot=None):
+        """Streaming /chat call; yields each decoded NDJSON chunk, holding a scheduler slot until the stream ends"""
+        slot = slot or await self.admit(priority)
+        start = time.monotonic()
+        ttft = None
+        try:
+            response = await self.request("POST", "/chat", slot=slot,
+                                          json=with_residency({**payload, "stream": True}))
+        except BaseException:
+            slot.release()
+            raise
+        try:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.error(f"Failed to parse JSON from stream: {line}")
+                    continue
+                if ttft is None and chunk.get("message", {}).get("content"):
+                    ttft = time.monotonic() - start
+                if chunk.get("done"):
+                    model_stats.record(payload.get("model"), chunk, ttft)
+                yield chunk
+        except httpx.HTTPError as e:
+            slot.backend.breaker.record_failure()
+            raise OllamaError(f"Ollama stream interrupted: {e!r}")
+        finally:
+            slot.release()
+            await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self):
+        return {"retries": self.retries}
+
+
+# Shared by every request handled on the ASGI server's event loop
+async_ollama_client = AsyncOllamaClient()
@@ -0,0 +1,103 @@
+"""Benchmark the RAG index types on synthetic corpora.
+
+Reports build time, index memory per 100k chunks, recall@k against exact
+search (with and without the exact re-rank RAGManager applies to compressed
+indexes) and p50/p99 single-query search latency (the cost
+RAGManager.retrieve pays per message) for each index kind and storage mode
+chosen by vector_index.
+
+    python bench_index.py --sizes 1000,10000,100000,1000000 --queries 200 --k 3
+    python bench_index.py --sizes 100000 --kinds flat --storages float32,fp16,sq8,pq
+"""
+import argparse
+import time
+
+import numpy as np
+import faiss
+
+from vector_index import INDEX_KINDS, STORAGE_MODES, build_index, choose_index_kind, effective_storage
+
+DIMENSIONS = 384  # all-MiniLM-L6-v2
+
+
+def synthetic_corpus(n, dim, n_queries, seed=0):
+    """Clustered, unit-normalized vectors that roughly resemble sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    n_topics = max(8, int(np.sqrt(n)))
+    centers = rng.standard_normal((n_topics, dim)).astype('float32')
+    labels = rng.integers(0, n_topics, n + n_queries)
+    data = centers[labels] + 0.6 * rng.standard_normal((n + n_queries, dim)).astype('float32')
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data[:n], data[n:]
+
+
+def bench_kind(kind, storage, corpus, queries, ground_truth, k, rerank_factor):
+    start = time.perf_counter()
+    index = build_index(kind, corpus, np.arange(len(corpus)), storage=storage)
+    build_seconds = time.perf_counter() - start
+    # The re-rank reads the float16 embedding cache, not the original float32 vectors
+    cached = corpus.astype('float16')
+
+    latencies = []
+    hits = 0
+    rerank_hits = 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(ids[0].tolist()) & set(ground_truth[i].tolist()))
+
+        _, candidates = index.search(query.reshape(1, -1), k * rerank_factor)
+        candidates = candidates[0][candidates[0] >= 0]
+        distances = ((cached[candidates].astype('float32') - query) ** 2).sum(axis=1)
+        reranked = candidates[np.argsort(distances, kind='stable')[:k]]
+        rerank_hits += len(set(reranked.tolist()) & set(ground_truth[i].tolist()))
+
+    return {
+        "build_s": build_seconds,
+        "mb_per_100k": len(faiss.serialize_index(index)) / len(corpus) * 100000 / 1e6,
+        "recall": hits / (len(queries) * k),
+        "rerank_recall": rerank_hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--kinds", default=",".join(INDEX_KINDS), help="comma-separated index kinds")
+    parser.add_argument("--storages", default="float32", help=f"comma-separated storage modes {STORAGE_MODES}")
+    parser.add_argument("--rerank-factor", type=int, default=4, help="candidates per result for the exact re-rank")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=DIMENSIONS)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (requests search serially)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    kinds = args.kinds.split(",")
+    storages = args.storages.split(",")
+
+    print(f"{'chunks':>9} {'index':>6} {'storage':>8} {'auto':>5} {'build s':>9} {'MB/100k':>8} "
+          f"{'recall@' + str(args.k):>9} {'reranked':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        corpus, queries = synthetic_corpus(size, args.dim, args.queries)
+
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(corpus)
+        _, ground_truth = exact.search(queries, args.k)
+
+        for kind in kinds:
+            for storage in storages:
+                result = bench_kind(kind, storage, corpus, queries, ground_truth, args.k, args.rerank_factor)
+                auto = "*" if choose_index_kind(size) == kind else ""
+                # Small corpora fall back to a larger code; report what was actually built
+                built = effective_storage(size, storage)
+                print(f"{size:>9} {kind:>6} {built:>8} {auto:>5} {result['build_s']:>9.2f} "
+                      f"{result['mb_per_100k']:>8.1f} {result['recall']:>9.3f} {result['rerank_recall']:>9.3f} "
+                      f"{result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Measure time to first token (TTFT) against a running Ollama server.
+
+Compares, for one model:
+
+  cold       first request after the model was unloaded (what users paid
+             after an idle period without keep_alive/preloading)
+  warm       the same request with the model resident
+  full       a multi-turn chat built the way OllamaChat did before
+             ConversationMemory: the system prompt, every earlier turn and the
+             new message, so the prompt grows with the conversation
+  memory     the same chat built by ConversationMemory, which replays at most
+             --window + CHAT_SUMMARY_BATCH recent turns and only moves the
+             replay start every CHAT_SUMMARY_BATCH turns
+
+and reports TTFT, model load time and the prompt tokens Ollama had to
+evaluate (tokens served from its prompt cache are not counted).
+
+    python bench_ttft.py --model gemma3:1b --turns 24 --window 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+from conversation_memory import ConversationMemory
+from ollama_client import ollama_client
+
+SYSTEM_PROMPT = "You are a healthcare assistant. Provide general health information and guidance only."
+QUESTIONS = [
+    "What is a normal fasting blood sugar level?",
+    "What does HbA1c measure?",
+    "Is 6.1% HbA1c high?",
+    "What foods raise blood sugar the most?",
+    "How much exercise helps with insulin resistance?",
+    "What are early symptoms of type 2 diabetes?",
+    "Can stress raise blood sugar?",
+    "How often should I test my blood sugar?",
+    "What is a normal blood pressure reading?",
+    "Does salt intake affect blood pressure?",
+    "What is LDL cholesterol?",
+    "Which lab results should I ask my doctor about?",
+]
+
+
+def timed_stream(model, messages, num_predict):
+    """Stream one reply; returns (reply, ttft seconds, final chunk)"""
+    start = time.monotonic()
+    ttft = None
+    reply = ""
+    final = {}
+    payload = {"model": model, "messages": messages, "options": {"num_predict": num_predict}}
+    for chunk in ollama_client.stream_chat(payload):
+        content = chunk.get("message", {}).get("content", "")
+        if content and ttft is None:
+            ttft = time.monotonic() - start
+        reply += content
+        if chunk.get("done"):
+            final = chunk
+    return reply, ttft or time.monotonic() - start, final
+
+
+def unload(model):
+    ollama_client.request("POST", "/chat", json={"model": model, "messages": [], "keep_alive": 0,
+                                                 "stream": False}).close()
+
+
+def row(name, ttfts, finals):
+    loads = [final.get("load_duration", 0) / 1e6 for final in finals]
+    prompt_tokens = [final.get("prompt_eval_count", 0) for final in finals]
+    print(f"{name:<8} ttft p50 {np.percentile(ttfts, 50) * 1000:8.1f} ms  p95 {np.percentile(ttfts, 95) * 1000:8.1f} ms  "
+          f"load p50 {np.percentile(loads, 50):8.1f} ms  prompt tokens evaluated avg {np.mean(prompt_tokens):7.1f}")
+
+
+def chat_run(model, turns, num_predict, build):
+    history = []
+    ttfts, finals = [], []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        reply, ttft, final = timed_stream(model, build(history, question), num_predict)
+        history.append((question, reply))
+        ttfts.append(ttft)
+        finals.append(final)
+    return ttfts, finals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="gemma3:1b")
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--window", type=int, default=4, help="turns ConversationMemory keeps verbatim")
+    parser.add_argument("--num-predict", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": QUESTIONS[0]}]
+    cold, cold_finals = [], []
+    for _ in range(args.repeats):
+        unload(args.model)
+        _, ttft, final = timed_stream(args.model, messages, args.num_predict)
+        cold.append(ttft)
+        cold_finals.append(final)
+    row("cold", cold, cold_finals)
+
+    ollama_client.load(args.model)
+    warm, warm_finals = [], []
+    for _ in range(args.repeats):
+        _, ttft, final = timed_stream(args.model, messages, args.num_predict)
+        warm.append(ttft)
+        warm_finals.append(final)
+    row("warm", warm, warm_finals)
+
+    def full(history, question):
+        # The baseline OllamaChat.send_message: replay the whole history on every request
+        replay = [{"role": role, "content": content} for q, a in history
+                  for role, content in (("user", q), ("assistant", a))]
+        return [{"role": "system", "content": SYSTEM_PROMPT}] + replay + [{"role": "user", "content": question}]
+    row("full", *chat_run(args.model, args.turns, args.num_predict, full))
+
+    def memory(history, question):
+        # No summarization calls during the benchmark: just the replay window of ConversationMemory
+        conversation = ConversationMemory(args.model, [{"role": role, "content": content} for q, a in history
+                                                 for role, content in (("user", q), ("assistant", a))],
+                                    max_turns=args.window, summary_batch=args.window)
+        return conversation.build(SYSTEM_PROMPT, question)
+    row("memory", *chat_run(args.model, args.turns, args.num_predict, memory))
+
+
+if __name__ == '__main__':
+    main()
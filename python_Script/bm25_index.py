@@ -0,0 +1,143 @@
+import os
+import re
+import math
+import logging
+
+import numpy as np
+
+# Okapi BM25 parameters
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Lower-cased words and numbers, keeping decimals ("5.6") and alphanumerics ("hba1c", "b12") whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Compact inverted index over chunk IDs, persisted as one .npz file.
+
+    Postings are stored CSR-style: postings for terms[i] are
+    posting_ids/posting_tfs[term_ptr[i]:term_ptr[i + 1]], sorted by chunk ID.
+    Updates merge the new postings in with numpy and rewrite the file via a
+    temp file + rename, like the FAISS index next to it.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._clear()
+        self._load()
+
+    def _clear(self):
+        self.terms = np.zeros(0, dtype='U1')
+        self.term_ptr = np.zeros(1, dtype='int64')
+        self.posting_ids = np.zeros(0, dtype='int64')
+        self.posting_tfs = np.zeros(0, dtype='int32')
+        self.doc_ids = np.zeros(0, dtype='int64')  # sorted
+        self.doc_lens = np.zeros(0, dtype='int32')
+        self._term_index = {}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.terms = data["terms"]
+                self.term_ptr = data["term_ptr"]
+                self.posting_ids = data["posting_ids"]
+                self.posting_tfs = data["posting_tfs"]
+                self.doc_ids = data["doc_ids"]
+                self.doc_lens = data["doc_lens"]
+            self._term_index = {term: i for i, term in enumerate(self.terms.tolist())}
+        except Exception as e:
+            logging.error(f"Error loading keyword index {self.path}: {e}")
+            self._clear()
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def _triples(self):
+        """Expand the CSR postings into parallel (term, chunk_id, tf) arrays"""
+        term_of_posting = np.repeat(self.terms, np.diff(self.term_ptr))
+        return term_of_posting, self.posting_ids, self.posting_tfs
+
+    def _set_postings(self, terms, ids, tfs):
+        """Rebuild the CSR arrays from unsorted (term, chunk_id, tf) triples"""
+        vocabulary, term_idx = np.unique(terms, return_inverse=True)
+        order = np.lexsort((ids, term_idx))
+        self.terms = vocabulary
+        self.posting_ids = ids[order].astype('int64')
+        self.posting_tfs = tfs[order].astype('int32')
+        counts = np.bincount(term_idx, minlength=len(vocabulary))
+        self.term_ptr = np.concatenate([[0], np.cumsum(counts)]).astype('int64')
+        self._term_index = {term: i for i, term in enumerate(self.terms.tolist())}
+
+    def add(self, chunk_ids, texts):
+        """Index texts under their chunk IDs"""
+        if not len(chunk_ids):
+            return
+        new_terms, new_ids, new_tfs, new_lens = [], [], [], []
+        for chunk_id, text in zip(chunk_ids, texts):
+            tokens = tokenize(text)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            new_terms.extend(counts)
+            new_ids.extend([chunk_id] * len(counts))
+            new_tfs.extend(counts.values())
+            new_lens.append(len(tokens))
+
+        terms, ids, tfs = self._triples()
+        self._set_postings(np.concatenate([terms, np.array(new_terms, dtype=str)]) if new_terms else terms,
+                           np.concatenate([ids, np.array(new_ids, dtype='int64')]),
+                           np.concatenate([tfs, np.array(new_tfs, dtype='int32')]))
+
+        doc_ids = np.concatenate([self.doc_ids, np.asarray(chunk_ids, dtype='int64')])
+        doc_lens = np.concatenate([self.doc_lens, np.array(new_lens, dtype='int32')])
+        order = np.argsort(doc_ids, kind='stable')
+        self.doc_ids = doc_ids[order]
+        self.doc_lens = doc_lens[order]
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, terms=self.terms, term_ptr=self.term_ptr, posting_ids=self.posting_ids,
+                     posting_tfs=self.posting_tfs, doc_ids=self.doc_ids, doc_lens=self.doc_lens)
+        os.replace(tmp_path, self.path)
+
+
+def search_indexes(indexes, query, top_k):
+    """BM25 over several indexes (e.g. segments) as if they were one, using their combined statistics"""
+    n_docs = sum(len(index.doc_ids) for index in indexes)
+    if not n_docs:
+        return []
+    avg_len = max(sum(float(index.doc_lens.sum()) for index in indexes) / n_docs, 1.0)
+
+    ids_parts, score_parts = [], []
+    for term in set(tokenize(query)):
+        postings = []
+        for index in indexes:
+            i = index._term_index.get(term)
+            if i is None:
+                continue
+            start, end = index.term_ptr[i], index.term_ptr[i + 1]
+            ids = index.posting_ids[start:end]
+            lens = index.doc_lens[np.searchsorted(index.doc_ids, ids)]
+            postings.append((ids, index.posting_tfs[start:end].astype('float32'), lens))
+        df = sum(len(ids) for ids, _, _ in postings)
+        if not df:
+            continue
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        for ids, tfs, lens in postings:
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lens / avg_len)
+            ids_parts.append(ids)
+            score_parts.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+    if not ids_parts:
+        return []
+
+    ids, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+    top = np.argsort(-scores, kind='stable')[:top_k]
+    return [(int(ids[i]), float(scores[i])) for i in top]
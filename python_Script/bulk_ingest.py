@@ -0,0 +1,196 @@
+"""Bulk-index existing patient document folders.
+
+Walks BASE_DATA_DIR/<email>/formilvus, shards every user's new or modified .txt
+files across a process pool that reads, chunks and embeds them in large
+batches, and commits each user's chunks to their index in the parent
+process (index and metadata are written via temp file + rename). Committed
+files are recorded in each user's file manifest, so an interrupted import
+resumes where it stopped, and a later run picks up files added since; a
+checkpoint keeps the running totals.
+
+Run it while the web app is stopped, or at least not serving the users being
+imported, since both would write the same per-user index:
+
+    python bulk_ingest.py --workers 8 --files-per-task 64
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embedding_service import embedding_service
+from chunker import chunk_file
+from rag_manager import BASE_DATA_DIR, RAGManager, file_record
+
+CHECKPOINT_NAME = ".bulk_ingest_checkpoint.json"
+
+
+def embed_shard(user_email, base_dir, file_paths, batch_size):
+    """Worker: read, chunk and embed a shard of one user's files"""
+    files = {}  # file name -> manifest record
+    chunks = []
+    for file_path in file_paths:
+        record = file_record(file_path)
+        if record is None:
+            continue
+        file_name = os.path.basename(file_path)
+        chunks.extend(chunk_file(file_path, file_name))
+        files[file_name] = record
+
+    texts = [chunk["text"] for chunk in chunks]
+    vectors = None
+    missing = list(range(len(texts)))
+    if texts:
+        # Reuse vectors the user's cache already holds; only the parent appends to it, so open it
+        # read-only and never truncate a tail the parent may be writing
+        cache = EmbeddingCache(os.path.join(base_dir, user_email, "vectors", "embedding_cache"), read_only=True)
+        vectors, missing = cache.get(texts)
+        if missing:
+            new_vectors = embedding_service.encode_direct([texts[i] for i in missing], batch_size=batch_size)
+            if vectors is None:
+                vectors = np.zeros((len(texts), new_vectors.shape[1]), dtype='float32')
+            vectors[missing] = new_vectors
+    return user_email, files, chunks, vectors, missing
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {"completed_users": [], "docs": 0, "chunks": 0}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def pending_files(manager):
+    """New or modified .txt files for a user, found by comparing the folder with the file manifest"""
+    stale_files, _ = manager.stale_documents()
+    return sorted(stale_files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-dir", default=BASE_DATA_DIR, help="folder holding one sub-folder per user")
+    parser.add_argument("--users", help="comma-separated user emails (default: every user folder)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--files-per-task", type=int, default=64, help="files per worker task")
+    parser.add_argument("--batch-size", type=int, default=256, help="texts per embedding forward pass")
+    parser.add_argument("--commit-chunks", type=int, default=50000,
+                        help="commit a user's index after this many buffered chunks")
+    parser.add_argument("--checkpoint", help=f"checkpoint file (default: <base-dir>/{CHECKPOINT_NAME})")
+    parser.add_argument("--restart", action="store_true", help="reset the checkpoint's totals")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    if os.path.abspath(args.base_dir) != os.path.abspath(BASE_DATA_DIR):
+        # RAGManager resolves user folders from the working directory
+        print("--base-dir must be the AAA folder under the current working directory", file=sys.stderr)
+        return 2
+
+    checkpoint_path = args.checkpoint or os.path.join(args.base_dir, CHECKPOINT_NAME)
+    checkpoint = {"completed_users": [], "docs": 0, "chunks": 0} if args.restart else load_checkpoint(checkpoint_path)
+
+    # Every user is checked, including ones a previous run completed: their manifests make
+    # already-indexed files cheap to skip, and files added since are picked up
+    users = args.users.split(",") if args.users else sorted(
+        name for name in os.listdir(args.base_dir)
+        if os.path.isdir(os.path.join(args.base_dir, name, "formilvus"))
+    )
+
+    # Shard every user's pending files into fixed-size tasks
+    tasks = []
+    remaining = {}
+    managers = {}  # users with pending files -> their manager, kept until the user is finished
+    for user_email in users:
+        manager = RAGManager(user_email)
+        files = pending_files(manager)
+        if files:
+            managers[user_email] = manager
+        shards = [files[i:i + args.files_per_task] for i in range(0, len(files), args.files_per_task)]
+        remaining[user_email] = len(shards)
+        tasks.extend((user_email, shard) for shard in shards)
+    total_files = sum(len(shard) for _, shard in tasks)
+    print(f"{len(users)} users, {total_files} files in {len(tasks)} tasks, {args.workers} workers")
+
+    buffers = {}  # user_email -> [files, chunks, vectors, cache_misses]
+    user_docs = {}
+    user_chunk_counts = {}
+    docs = chunks = 0
+    start = last_report = time.monotonic()
+
+    def commit(user_email):
+        files, user_chunks, vectors, misses = buffers.pop(user_email)
+        manager = managers[user_email]
+        if misses:
+            manager.embedding_cache.put([user_chunks[i]["text"] for i in misses], vectors[misses])
+        if files:
+            manager.add_embedded_chunks(files, user_chunks, vectors)
+
+    def finish_user(user_email):
+        if user_email in buffers:
+            commit(user_email)
+        manager = managers.pop(user_email, None)
+        if manager is not None:
+            # Compact now: the job add_embedded_chunks queued runs on daemon threads that exit with us
+            manager.compact_segments()
+        if user_email not in checkpoint["completed_users"]:
+            checkpoint["completed_users"].append(user_email)
+        checkpoint["docs"] += user_docs.pop(user_email, 0)
+        checkpoint["chunks"] += user_chunk_counts.pop(user_email, 0)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    for user_email in users:
+        if remaining[user_email] == 0:
+            finish_user(user_email)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(embed_shard, user_email, args.base_dir, shard, args.batch_size)
+                   for user_email, shard in tasks]
+        for future in as_completed(futures):
+            user_email, files, shard_chunks, vectors, misses = future.result()
+
+            buffer = buffers.setdefault(user_email, [{}, [], None, []])
+            offset = len(buffer[1])
+            buffer[0].update(files)
+            buffer[1].extend(shard_chunks)
+            if vectors is not None and len(vectors):
+                buffer[2] = vectors if buffer[2] is None else np.vstack([buffer[2], vectors])
+            buffer[3].extend(offset + i for i in misses)
+
+            docs += len(files)
+            chunks += len(shard_chunks)
+            user_docs[user_email] = user_docs.get(user_email, 0) + len(files)
+            user_chunk_counts[user_email] = user_chunk_counts.get(user_email, 0) + len(shard_chunks)
+
+            remaining[user_email] -= 1
+            if remaining[user_email] == 0:
+                finish_user(user_email)
+            elif len(buffer[1]) >= args.commit_chunks:
+                commit(user_email)
+
+            now = time.monotonic()
+            if now - last_report >= 10:
+                elapsed = now - start
+                print(f"{docs}/{total_files} docs, {chunks} chunks - "
+                      f"{docs / elapsed:.1f} docs/s, {chunks / elapsed:.1f} chunks/s")
+                last_report = now
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(f"Done: {docs} docs, {chunks} chunks in {elapsed:.1f}s - "
+          f"{docs / elapsed:.1f} docs/s, {chunks / elapsed:.1f} chunks/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
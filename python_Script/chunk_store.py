@@ -0,0 +1,272 @@
+import os
+import json
+import mmap
+import pickle
+import logging
+import threading
+
+import numpy as np
+
+# One fixed-size record per chunk; chunk IDs are appended in increasing order so
+# lookups are a binary search over the memory-mapped id column
+RECORD_DTYPE = np.dtype([('id', '<i8'), ('offset', '<i8'), ('length', '<i4'), ('source', '<i4')])
+DELETED = -1
+
+# Rewrite the store once this fraction of its records are deleted
+CHUNK_STORE_MAX_DEAD_FRACTION = float(os.getenv("CHUNK_STORE_MAX_DEAD_FRACTION", "0.5"))
+
+
+class ChunkStore:
+    """Columnar, memory-mapped store of chunk text and sources.
+
+    chunks.<gen>.txt holds the UTF-8 text of every chunk back to back,
+    chunks.<gen>.idx an array of (id, offset, length, source_id) records and
+    sources.txt the source-file table, one name per line. All three are
+    append-only; deleting a chunk marks its record in place and compact()
+    writes a new generation that chunks.json switches to atomically.
+
+    Writers remap the files, so every read takes the same lock. Chunk IDs are
+    never reused, not even after clear().
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.sources_path = os.path.join(folder, "sources.txt")
+        self.state_path = os.path.join(folder, "chunks.json")
+        self._lock = threading.RLock()
+        os.makedirs(folder, exist_ok=True)
+        self._open()
+
+    def _paths(self, generation):
+        return (os.path.join(self.folder, f"chunks.{generation}.txt"),
+                os.path.join(self.folder, f"chunks.{generation}.idx"))
+
+    def _open(self):
+        """Map the store files; only the source table is read into memory"""
+        self._records = None
+        self._text = None
+        self.next_id = 0
+        self.generation = 0
+        self.source_names = []
+        self.source_ids = {}
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            self.next_id = state.get("next_id", 0)
+            self.generation = state.get("generation", 0)
+        self.text_path, self.records_path = self._paths(self.generation)
+        if os.path.exists(self.sources_path):
+            with open(self.sources_path, 'r', encoding='utf-8') as f:
+                self.source_names = f.read().splitlines()
+            self.source_ids = {name: i for i, name in enumerate(self.source_names)}
+
+        count = 0
+        if os.path.exists(self.records_path):
+            size = os.path.getsize(self.records_path)
+            count = size // RECORD_DTYPE.itemsize
+            if size != count * RECORD_DTYPE.itemsize:
+                # Drop a partially written record so later appends stay aligned
+                with open(self.records_path, 'r+b') as f:
+                    f.truncate(count * RECORD_DTYPE.itemsize)
+        if count:
+            self._records = np.memmap(self.records_path, dtype=RECORD_DTYPE, mode='r+', shape=(count,))
+            self.next_id = max(self.next_id, int(self._records['id'][-1]) + 1)
+        if os.path.exists(self.text_path) and os.path.getsize(self.text_path):
+            with open(self.text_path, 'rb') as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._live = int(np.count_nonzero(self._records['source'] != DELETED)) if count else 0
+
+    def _close(self):
+        if self._records is not None:
+            self._records.flush()
+        self._records = None
+        if self._text is not None:
+            self._text.close()
+        self._text = None
+
+    def __len__(self):
+        return self._live
+
+    def __contains__(self, chunk_id):
+        with self._lock:
+            return self._position(chunk_id) is not None
+
+    def _position(self, chunk_id):
+        """Record index of a live chunk, or None; the caller holds the lock"""
+        if self._records is None:
+            return None
+        ids = self._records['id']
+        pos = int(np.searchsorted(ids, chunk_id))
+        if pos < len(ids) and ids[pos] == chunk_id and self._records['source'][pos] != DELETED:
+            return pos
+        return None
+
+    def get(self, chunk_id):
+        """Return {"text", "source"} for a live chunk, or None"""
+        with self._lock:
+            pos = self._position(chunk_id)
+            if pos is None:
+                return None
+            record = self._records[pos]
+            start = int(record['offset'])
+            text = self._text[start:start + int(record['length'])].decode('utf-8')
+            return {"text": text, "source": self.source_names[int(record['source'])]}
+
+    def live_ids(self):
+        with self._lock:
+            if self._records is None:
+                return []
+            return self._records['id'][self._records['source'] != DELETED].tolist()
+
+    def live_mask(self, chunk_ids):
+        """Boolean array marking which of chunk_ids are live"""
+        chunk_ids = np.asarray(chunk_ids, dtype='int64')
+        with self._lock:
+            if self._records is None or not len(chunk_ids):
+                return np.zeros(len(chunk_ids), dtype=bool)
+            ids = self._records['id']
+            pos = np.minimum(np.searchsorted(ids, chunk_ids), len(ids) - 1)
+            return (ids[pos] == chunk_ids) & (self._records['source'][pos] != DELETED)
+
+    def ids_for_source(self, source):
+        with self._lock:
+            source_id = self.source_ids.get(source)
+            if source_id is None or self._records is None:
+                return []
+            return self._records['id'][self._records['source'] == source_id].tolist()
+
+    def texts(self, chunk_ids):
+        """Text of each chunk, in order; raises KeyError for a deleted or unknown ID"""
+        with self._lock:
+            texts = []
+            for chunk_id in chunk_ids:
+                chunk = self.get(chunk_id)
+                if chunk is None:
+                    raise KeyError(f"Chunk {chunk_id} is deleted or unknown in {self.folder}")
+                texts.append(chunk["text"])
+            return texts
+
+    def append(self, chunk_ids, chunks):
+        """Append chunks under the given (increasing) IDs, writing only the new tail"""
+        if not chunks:
+            return
+        with self._lock:
+            new_sources = []
+            for chunk in chunks:
+                if chunk["source"] not in self.source_ids:
+                    self.source_ids[chunk["source"]] = len(self.source_names)
+                    self.source_names.append(chunk["source"])
+                    new_sources.append(chunk["source"])
+
+            offset = os.path.getsize(self.text_path) if os.path.exists(self.text_path) else 0
+            records = np.zeros(len(chunks), dtype=RECORD_DTYPE)
+            blobs = []
+            for i, (chunk_id, chunk) in enumerate(zip(chunk_ids, chunks)):
+                data = chunk["text"].encode('utf-8')
+                records[i] = (chunk_id, offset, len(data), self.source_ids[chunk["source"]])
+                blobs.append(data)
+                offset += len(data)
+
+            self._close()
+            # Text and sources before records, so a crash never leaves a record pointing past the data
+            with open(self.text_path, 'ab') as f:
+                f.write(b"".join(blobs))
+            if new_sources:
+                with open(self.sources_path, 'a', encoding='utf-8') as f:
+                    f.write("".join(name + "\n" for name in new_sources))
+            with open(self.records_path, 'ab') as f:
+                f.write(records.tobytes())
+            self.next_id = max(self.next_id, int(records['id'][-1]) + 1)
+            self._write_state()
+            self._open()
+
+    def remove(self, chunk_ids):
+        """Mark chunks deleted in place, compacting once most records are dead"""
+        with self._lock:
+            removed = 0
+            for chunk_id in chunk_ids:
+                pos = self._position(chunk_id)
+                if pos is not None:
+                    self._records['source'][pos] = DELETED
+                    removed += 1
+            if removed:
+                self._records.flush()
+                self._live -= removed
+                if 1 - self._live / len(self._records) > CHUNK_STORE_MAX_DEAD_FRACTION:
+                    self.compact()
+            return removed
+
+    def compact(self):
+        """Rewrite the store without deleted chunks"""
+        with self._lock:
+            if self._records is None:
+                return
+            live = self._records[self._records['source'] != DELETED]
+            records = np.zeros(len(live), dtype=RECORD_DTYPE)
+            blobs = []
+            offset = 0
+            for i, record in enumerate(live):
+                start = int(record['offset'])
+                data = self._text[start:start + int(record['length'])]
+                records[i] = (record['id'], offset, len(data), record['source'])
+                blobs.append(data)
+                offset += len(data)
+
+            self._close()
+            old_paths = (self.text_path, self.records_path)
+            text_path, records_path = self._paths(self.generation + 1)
+            with open(text_path, 'wb') as f:
+                f.write(b"".join(blobs))
+            with open(records_path, 'wb') as f:
+                f.write(records.tobytes())
+            # Switching chunks.json publishes the new generation atomically
+            self.generation += 1
+            self._write_state()
+            for path in old_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            self._open()
+            logging.info(f"Compacted chunk store {self.folder} to {len(records)} chunks")
+
+    def clear(self):
+        """Delete every chunk; new chunks continue from next_id so cached IDs never match them"""
+        with self._lock:
+            next_id = self.next_id
+            self._close()
+            for path in (self.text_path, self.records_path, self.sources_path, self.state_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._open()
+            self.next_id = next_id
+            self._write_state()
+
+    def _write_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"next_id": self.next_id, "generation": self.generation}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def nbytes(self):
+        size = 0
+        for path in (self.text_path, self.records_path):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        return size
+
+    def import_pickle(self, path):
+        """Move a legacy text_chunks.pkl ({"chunks": {id: chunk}} or a positional list) into the store"""
+        with open(path, 'rb') as f:
+            stored = pickle.load(f)
+        if isinstance(stored, list):
+            chunk_ids = list(range(len(stored)))
+            chunks = stored
+            next_id = len(stored)
+        else:
+            chunk_ids = sorted(stored["chunks"])
+            chunks = [stored["chunks"][chunk_id] for chunk_id in chunk_ids]
+            next_id = stored["next_chunk_id"]
+        self.clear()
+        self.append(chunk_ids, chunks)
+        self.next_id = max(self.next_id, next_id)
+        self._write_state()
+        return isinstance(stored, list)
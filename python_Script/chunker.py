@@ -0,0 +1,156 @@
+import os
+import re
+import codecs
+
+# Chunk size and overlap in tokens. Tokens are counted as words and punctuation marks,
+# which stays below the embedding model's 256-wordpiece input limit at these sizes
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))
+# Hard cap on chunk length in characters. Word counting sees a long run without spaces
+# (IDs, base64, CJK text) as one token, so this is what bounds such chunks
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+CHUNK_MIN_CHARS = 20  # Only include meaningful chunks
+
+READ_BLOCK_SIZE = 64 * 1024
+# Text without any sentence or line break is cut at a word boundary once it reaches this size
+MAX_UNIT_CHARS = 4096
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Sentence ends followed by whitespace, and line breaks (lab values and list items are one per line)
+UNIT_BREAK = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+
+
+def count_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def iter_text(file_path, block_size=READ_BLOCK_SIZE):
+    """Yield a file's text block by block, switching to latin-1 from the first invalid UTF-8 byte"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    latin1 = False
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            if latin1:
+                yield data.decode('latin-1')
+                continue
+            try:
+                text = decoder.decode(data)
+            except UnicodeDecodeError as e:
+                # Keep the valid UTF-8 before the bad byte and decode from it on as latin-1;
+                # e.object holds the bytes buffered from the previous block followed by this one
+                latin1 = True
+                text = e.object[:e.start].decode('utf-8') + e.object[e.start:].decode('latin-1')
+            yield text
+    if not latin1:
+        tail = decoder.decode(b"", final=False)
+        pending, _ = decoder.getstate()
+        yield tail + pending.decode('latin-1')
+
+
+def iter_units(blocks):
+    """Split streamed text into whitespace-normalized sentences and lines, holding at most one partial unit"""
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        parts = UNIT_BREAK.split(buffer)
+        buffer = parts.pop()
+        for part in parts:
+            unit = " ".join(part.split())
+            if unit:
+                yield unit
+        while len(buffer) > MAX_UNIT_CHARS:
+            cut = buffer.rfind(" ", 0, MAX_UNIT_CHARS)
+            cut = cut if cut > 0 else MAX_UNIT_CHARS
+            unit = " ".join(buffer[:cut].split())
+            if unit:
+                yield unit
+            buffer = buffer[cut:]
+    unit = " ".join(buffer.split())
+    if unit:
+        yield unit
+
+
+def _split_long_unit(unit, max_tokens, overlap_tokens, max_chars):
+    """Window a single over-long sentence by words, cutting words longer than max_chars"""
+    words = [word[i:i + max_chars] for word in unit.split(" ") for i in range(0, len(word), max_chars)]
+    start = 0
+    while start < len(words):
+        piece = []
+        tokens = 0
+        chars = -1  # no separator before the first word
+        end = start
+        while end < len(words) and (not piece or (tokens + count_tokens(words[end]) <= max_tokens and
+                                                  chars + 1 + len(words[end]) <= max_chars)):
+            tokens += count_tokens(words[end])
+            chars += 1 + len(words[end])
+            piece.append(words[end])
+            end += 1
+        yield " ".join(piece)
+        if end >= len(words):
+            break
+        # Step back so consecutive windows share about overlap_tokens
+        back = end
+        shared = 0
+        while back > start + 1 and shared < overlap_tokens:
+            back -= 1
+            shared += count_tokens(words[back])
+        start = back if back > start else end
+
+
+def chunk_stream(blocks, source, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                 max_chars=CHUNK_MAX_CHARS):
+    """Yield {"text", "source"} chunks of whole sentences up to max_tokens and max_chars, consecutive
+    chunks repeating up to overlap_tokens of trailing sentences"""
+    window = []  # (unit, tokens)
+    total = 0
+    chars = -1  # length of the window's text; no separator before the first unit
+    fresh = False  # whether the window holds anything not yet emitted
+
+    def emit(units):
+        text = " ".join(unit for unit, _ in units)
+        if len(text) > CHUNK_MIN_CHARS:
+            return {"text": text, "source": source}
+        return None
+
+    for unit in iter_units(blocks):
+        tokens = count_tokens(unit)
+        if tokens > max_tokens or len(unit) > max_chars:
+            if fresh:
+                chunk = emit(window)
+                if chunk:
+                    yield chunk
+            for piece in _split_long_unit(unit, max_tokens, overlap_tokens, max_chars):
+                if len(piece) > CHUNK_MIN_CHARS:
+                    yield {"text": piece, "source": source}
+            window, total, chars, fresh = [], 0, -1, False
+            continue
+
+        if (total + tokens > max_tokens or chars + 1 + len(unit) > max_chars) and window:
+            if fresh:
+                chunk = emit(window)
+                if chunk:
+                    yield chunk
+            # Keep trailing sentences as overlap, as long as the new sentence still fits
+            while window and (total > overlap_tokens or total + tokens > max_tokens or
+                              chars + 1 + len(unit) > max_chars):
+                dropped, dropped_tokens = window.pop(0)
+                total -= dropped_tokens
+                chars -= 1 + len(dropped)
+        window.append((unit, tokens))
+        total += tokens
+        chars += 1 + len(unit)
+        fresh = True
+
+    if fresh:
+        chunk = emit(window)
+        if chunk:
+            yield chunk
+
+
+def chunk_file(file_path, source, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+               max_chars=CHUNK_MAX_CHARS):
+    """Stream a text file from disk into chunks without holding the whole document in memory"""
+    return chunk_stream(iter_text(file_path), source, max_tokens, overlap_tokens, max_chars)
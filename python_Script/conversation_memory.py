@@ -0,0 +1,162 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .chunker import count_tokens
+    from .ollama_client import ollama_client, OllamaError
+    from .llm_scheduler import LLMOverloaded, PRIORITY_BACKGROUND
+    from .model_routing import task_payload
+except ImportError:  # run from python_Script rather than imported as a package
+    from chunker import count_tokens
+    from ollama_client import ollama_client, OllamaError
+    from llm_scheduler import LLMOverloaded, PRIORITY_BACKGROUND
+    from model_routing import task_payload
+
+# Turns (a user message and its reply) always kept verbatim, as far as the token budget allows
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "6"))
+# Older turns are folded into the running summary once this many have piled up beyond
+# CHAT_HISTORY_TURNS, so one summarization call covers several turns
+CHAT_SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "4"))
+# Prompt tokens for the system prompt, summary, history and the new message (including any RAG
+# context or document text); keep it below the model's context window to leave room for the reply
+CHAT_PROMPT_TOKENS = int(os.getenv("CHAT_PROMPT_TOKENS", "3072"))
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "2"))
+# Each folded message is cut to this many characters in the summarization prompt (document prompts are long)
+SUMMARY_MESSAGE_CHARS = 1500
+
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summaries")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a healthcare assistant.
+Keep the health facts the user shared (conditions, symptoms, medications, test results, documents discussed),
+the advice given and any open questions. Reply with the updated summary only, in at most 150 words.
+
+Current summary:
+{summary}
+
+Conversation turns to add:
+{turns}"""
+
+
+class ConversationMemory:
+    """Chat history kept as a running summary plus the most recent turns.
+
+    Up to max_turns + summary_batch turns are kept verbatim; beyond that the
+    oldest are folded into the summary by a background call, so a request
+    never waits on summarization, which runs on the summary task's model
+    unless one is given. Turns leave the history only once a summary covering
+    them exists; after a failed call they are retried with the next batch.
+    build() fits the system prompt, summary, verbatim turns and the new
+    message into CHAT_PROMPT_TOKENS, dropping the oldest turns first.
+
+    Everything before the new message is kept byte-stable between requests so
+    Ollama can reuse its cached evaluation of that prefix: the summary only
+    changes when turns are folded, and when the budget forces old turns out
+    the replay start moves in steps of summary_batch turns, not one per turn.
+    """
+    def __init__(self, model=None, history=None, max_turns=CHAT_HISTORY_TURNS, token_budget=CHAT_PROMPT_TOKENS,
+                 summary_batch=CHAT_SUMMARY_BATCH):
+        self.model = model
+        self.history = list(history or [])  # {"role", "content"} messages not yet summarized, oldest first
+        self.summary = ""
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_batch = summary_batch
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    def build(self, system, message):
+        """Messages for Ollama's chat API within the token budget"""
+        with self._lock:
+            history = list(self.history)
+            summary = self.summary
+
+        # The system prompt and the new message are always sent
+        fixed = count_tokens(message) + (count_tokens(system) if system else 0)
+        budget = self.token_budget - fixed
+
+        # The summary is a separate system message so the system prompt stays a stable prefix
+        summary_message = None
+        if summary:
+            summary_message = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+            if count_tokens(summary_message["content"]) <= budget:
+                budget -= count_tokens(summary_message["content"])
+            else:
+                summary_message = None
+
+        # Pick where to start replaying the kept turns: the earliest start on a grid of summary_batch
+        # turns whose suffix fits, or failing that, the earliest start that fits at all
+        turns = [history[i:i + 2] for i in range(0, len(history), 2)]
+        suffix_tokens = [0] * (len(turns) + 1)
+        for i in range(len(turns) - 1, -1, -1):
+            suffix_tokens[i] = suffix_tokens[i + 1] + sum(count_tokens(entry["content"]) for entry in turns[i])
+        # More turns than that are only left while a summarization is running or after one failed
+        earliest = max(0, len(turns) - self.max_turns - self.summary_batch)
+        fitting = [i for i in range(earliest, len(turns) + 1) if suffix_tokens[i] <= budget]
+        start = fitting[0] if fitting else len(turns)
+        if start % self.summary_batch:
+            on_grid = start + self.summary_batch - start % self.summary_batch
+            start = on_grid if on_grid < len(turns) else start
+
+        recent = [{"role": "user" if entry["role"] == "user" else "assistant", "content": entry["content"]}
+                  for turn in turns[start:] for entry in turn]
+        # Never start the replayed history with a reply whose question was dropped
+        if recent and recent[0]["role"] != "user":
+            recent.pop(0)
+
+        # If what is actually sent is still over the budget, drop the oldest turns, then the summary
+        used = fixed + sum(count_tokens(entry["content"]) for entry in recent)
+        if summary_message:
+            used += count_tokens(summary_message["content"])
+        while used > self.token_budget and recent:
+            used -= count_tokens(recent.pop(0)["content"])
+            while recent and recent[0]["role"] != "user":
+                used -= count_tokens(recent.pop(0)["content"])
+        if used > self.token_budget and summary_message:
+            used -= count_tokens(summary_message["content"])
+            summary_message = None
+        if used > self.token_budget:
+            logging.warning(f"Prompt exceeds the {self.token_budget} token budget by {used - self.token_budget} tokens")
+
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        if summary_message:
+            messages.append(summary_message)
+        messages.extend(recent)
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    def add(self, message, response_text):
+        """Append a completed exchange and start summarizing once enough old turns have piled up"""
+        with self._lock:
+            self.history.append({"role": "user", "content": message})
+            self.history.append({"role": "assistant", "content": response_text})
+            old = len(self.history) - 2 * self.max_turns
+            if self._summarizing or old < 2 * self.summary_batch:
+                return
+            self._summarizing = True
+            to_fold = self.history[:old]
+            summary = self.summary
+        summary_executor.submit(self._summarize, to_fold, summary)
+
+    def _summarize(self, to_fold, summary):
+        turns = "\n".join(f"{'User' if entry['role'] == 'user' else 'Assistant'}: "
+                          f"{entry['content'][:SUMMARY_MESSAGE_CHARS]}" for entry in to_fold)
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", turns=turns)
+        summary = None
+        try:
+            result = ollama_client.chat(task_payload("summary", [{"role": "user", "content": prompt}], self.model),
+                                        priority=PRIORITY_BACKGROUND)
+            summary = result["message"]["content"].strip()
+        except (OllamaError, LLMOverloaded, KeyError) as e:
+            # Keep the turns: the next add() folds them again together with the ones added since
+            logging.error(f"Error summarizing conversation, keeping the turns for the next attempt: {e}")
+        finally:
+            with self._lock:
+                # Only appends happen meanwhile, so the folded turns are still the oldest ones
+                if summary is not None and self.history[:len(to_fold)] == to_fold:
+                    del self.history[:len(to_fold)]
+                    self.summary = summary
+                self._summarizing = False
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+from embedding_service import embedding_service, EMBEDDING_MODEL
+
+# float16 halves the cache size; vectors are upcast to float32 before they reach FAISS
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+
+KEY_BYTES = 20  # sha1 digest
+
+
+class EmbeddingCache:
+    """Persistent chunk-embedding cache keyed by a hash of (model name, chunk text).
+
+    Vectors live in an append-only raw array that is memory-mapped for reads,
+    with a parallel file of fixed-size hash keys; only the key -> row map is
+    held in memory.
+
+    A read_only cache (e.g. in a bulk ingest worker while the parent appends)
+    never writes, truncates or deletes the files; it sees the rows whose key
+    and vector were both complete when it was opened.
+    """
+    def __init__(self, folder, model_name=EMBEDDING_MODEL, dtype=EMBEDDING_CACHE_DTYPE, encoder=None,
+                 read_only=False):
+        self.folder = folder
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.encoder = encoder or embedding_service.encode
+        self.read_only = read_only
+        self.keys_path = os.path.join(folder, "keys.bin")
+        self.vectors_path = os.path.join(folder, "vectors.bin")
+        self.meta_path = os.path.join(folder, "meta.json")
+        self.dim = None
+        self.rows = {}
+        self._vectors = None  # memmap, reopened after appends
+        self._lock = threading.Lock()
+        if not read_only:
+            os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def _load(self):
+        """Read the key file and reconcile it with the vector file after a partial write"""
+        try:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("dtype") != self.dtype.name:
+                logging.info(f"Embedding cache dtype changed, discarding {self.folder}")
+                self._reset()
+                return
+            self.dim = meta["dim"]
+
+            with open(self.keys_path, 'rb') as f:
+                keys = f.read()
+            row_bytes = self.dim * self.dtype.itemsize
+            count = min(len(keys) // KEY_BYTES, os.path.getsize(self.vectors_path) // row_bytes)
+
+            # Drop any tail left behind by an interrupted append; a reader just ignores it, as the
+            # owner may be in the middle of writing it
+            if not self.read_only:
+                if len(keys) != count * KEY_BYTES:
+                    with open(self.keys_path, 'r+b') as f:
+                        f.truncate(count * KEY_BYTES)
+                if os.path.getsize(self.vectors_path) != count * row_bytes:
+                    with open(self.vectors_path, 'r+b') as f:
+                        f.truncate(count * row_bytes)
+
+            self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(count)}
+            logging.info(f"Loaded embedding cache with {count} vectors from {self.folder}")
+        except Exception as e:
+            logging.error(f"Error loading embedding cache: {e}")
+            self._reset()
+
+    def _reset(self):
+        self.dim = None
+        self.rows = {}
+        self._vectors = None
+        if self.read_only:
+            return
+        for path in (self.keys_path, self.vectors_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _matrix(self):
+        if self._vectors is None and self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r',
+                                      shape=(len(self.rows), self.dim))
+        return self._vectors
+
+    def get(self, texts):
+        """Return (vectors, missing) where missing lists the positions not in the cache"""
+        with self._lock:
+            keys = [self.key(text) for text in texts]
+            missing = [i for i, key in enumerate(keys) if key not in self.rows]
+            if self.dim is None:
+                return None, missing
+            vectors = np.zeros((len(texts), self.dim), dtype='float32')
+            hits = [i for i, key in enumerate(keys) if key in self.rows]
+            if hits:
+                matrix = self._matrix()
+                vectors[hits] = matrix[[self.rows[keys[i]] for i in hits]]
+            return vectors, missing
+
+    def put(self, texts, vectors):
+        """Append vectors for texts that are not cached yet"""
+        if self.read_only:
+            raise ValueError(f"Embedding cache {self.folder} is open read-only")
+        vectors = np.asarray(vectors, dtype='float32')
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, 'w') as f:
+                    json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+
+            new_keys = []
+            new_rows = []
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                if key in self.rows or key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # Vectors first, keys second: a crash leaves at most an orphaned vector tail
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+            with open(self.keys_path, 'ab') as f:
+                f.write(b"".join(new_keys))
+            start = len(self.rows)
+            for i, key in enumerate(new_keys):
+                self.rows[key] = start + i
+            self._vectors = None
+
+    def embed(self, texts):
+        """Embed texts, only running the encoder for ones that are not cached"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype='float32')
+        vectors, missing = self.get(texts)
+        if missing:
+            new_vectors = np.asarray(self.encoder([texts[i] for i in missing]), dtype='float32')
+            if vectors is None:
+                vectors = np.zeros((len(texts), new_vectors.shape[1]), dtype='float32')
+            vectors[missing] = new_vectors
+            self.put([texts[i] for i in missing], new_vectors)
+        logging.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        return vectors
+
+    def compact(self, keep_texts):
+        """Rewrite the cache keeping only vectors for keep_texts"""
+        if self.read_only:
+            raise ValueError(f"Embedding cache {self.folder} is open read-only")
+        with self._lock:
+            if not self.rows:
+                return
+            keep = []
+            seen = set()
+            for text in keep_texts:
+                key = self.key(text)
+                if key in self.rows and key not in seen:
+                    keep.append(key)
+                    seen.add(key)
+            matrix = self._matrix()
+            rows = np.asarray(matrix[[self.rows[key] for key in keep]]) if keep else np.zeros((0, self.dim), dtype=self.dtype)
+
+            tmp_vectors = self.vectors_path + ".tmp"
+            tmp_keys = self.keys_path + ".tmp"
+            with open(tmp_vectors, 'wb') as f:
+                f.write(rows.astype(self.dtype).tobytes())
+            with open(tmp_keys, 'wb') as f:
+                f.write(b"".join(keep))
+            self._vectors = None
+            del matrix
+            # Remove the keys first so a crash between the renames leaves an empty cache, never a mismatched one
+            os.remove(self.keys_path)
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_keys, self.keys_path)
+            logging.info(f"Compacted embedding cache from {len(self.rows)} to {len(keep)} vectors")
+            self.rows = {key: i for i, key in enumerate(keep)}
@@ -0,0 +1,141 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+from sentence_transformers import SentenceTransformer
+import numpy as np
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Micro-batching of encode calls coming from concurrent requests
+EMBEDDING_BATCH_MAX = int(os.getenv("EMBEDDING_BATCH_MAX", "64"))  # texts per forward pass before flushing
+EMBEDDING_BATCH_WAIT_MS = int(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))  # how long to wait for more requests
+EMBEDDING_QUEUE_SIZE = int(os.getenv("EMBEDDING_QUEUE_SIZE", "256"))  # pending encode requests
+EMBEDDING_QUEUE_TIMEOUT = float(os.getenv("EMBEDDING_QUEUE_TIMEOUT", "30"))  # seconds to wait for a queue slot
+
+
+class EmbeddingQueueFull(Exception):
+    """Raised when the embedding request queue stays full past the timeout"""
+
+
+class _EncodeRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingService:
+    """One process-wide SentenceTransformer shared by every RAGManager.
+
+    Callers block on encode() while a single worker thread drains a bounded
+    queue, concatenating requests that arrive within a short window into one
+    forward pass.
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL, max_batch=EMBEDDING_BATCH_MAX,
+                 max_wait_ms=EMBEDDING_BATCH_WAIT_MS, queue_size=EMBEDDING_QUEUE_SIZE):
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _get_model(self):
+        """Load the model exactly once per process"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    try:
+                        self._model = SentenceTransformer(self.model_name)
+                        logging.info(f"Loaded shared embedding model {self.model_name}")
+                    except Exception as e:
+                        logging.error(f"Failed to load embedding model: {e}")
+                        raise
+        return self._model
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def warmup(self):
+        """Load the model and run one forward pass so the first user query is fast"""
+        try:
+            self.encode(["warmup"])
+            logging.info("Embedding model warmed up")
+        except Exception as e:
+            logging.error(f"Embedding warmup failed: {e}")
+
+    def encode(self, texts):
+        """Embed a list of texts, returning a float32 array of shape (len(texts), dim)"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension()), dtype='float32')
+
+        self._ensure_worker()
+        request = _EncodeRequest(texts)
+        try:
+            self._queue.put(request, timeout=EMBEDDING_QUEUE_TIMEOUT)
+        except queue.Full:
+            raise EmbeddingQueueFull(f"Embedding queue full ({self._queue.maxsize} pending requests)")
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def encode_direct(self, texts, batch_size=256):
+        """Encode on the calling thread with a large batch size, for offline bulk jobs"""
+        model = self._get_model()
+        return np.asarray(model.encode(list(texts), batch_size=batch_size, show_progress_bar=False), dtype='float32')
+
+    def dimension(self):
+        return self._get_model().get_sentence_embedding_dimension()
+
+    def _collect_batch(self):
+        """Block for one request, then gather more until the batch is full or the window closes"""
+        batch = [self._queue.get()]
+        count = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                model = self._get_model()
+                vectors = np.asarray(model.encode(texts, show_progress_bar=False), dtype='float32')
+                offset = 0
+                for request in batch:
+                    request.result = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logging.error(f"Error encoding batch of {len(texts)} texts: {e}")
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+# Global embedding service shared by all users and requests
+embedding_service = EmbeddingService()
@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+# Background document ingestion
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "500"))
+INGEST_JOB_TTL_HOURS = int(os.getenv("INGEST_JOB_TTL_HOURS", "24"))
+
+
+class IngestQueueFull(Exception):
+    """Raised when too many ingestion jobs are already pending"""
+
+
+class IngestJob:
+    """A unit of background work for one user, addressed by an idempotent job ID"""
+    def __init__(self, job_id, user_email, task, description=""):
+        self.job_id = job_id
+        self.user_email = user_email
+        self.task = task
+        self.description = description
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = None
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished = threading.Event()
+        self._stages_reached = set()
+        self._stage_events = {}
+        self._lock = threading.Lock()
+
+    def set_stage(self, stage, **result):
+        """Record progress; callers can wait_for_stage() on it"""
+        with self._lock:
+            self.stage = stage
+            if result:
+                self.result = {**(self.result or {}), **result}
+            self.updated_at = time.time()
+            self._stages_reached.add(stage)
+            self._stage_event(stage).set()
+
+    def _stage_event(self, stage):
+        if stage not in self._stage_events:
+            self._stage_events[stage] = threading.Event()
+            if self.finished.is_set():
+                self._stage_events[stage].set()
+        return self._stage_events[stage]
+
+    def finish(self, status, error=None):
+        """Mark the job finished and wake everyone waiting on a stage it will never reach"""
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.updated_at = time.time()
+            self.finished.set()
+            for event in self._stage_events.values():
+                event.set()
+
+    def wait_for_stage(self, stage, timeout=None):
+        """Block until the job reaches stage or finishes; True if the stage was reached"""
+        with self._lock:
+            event = self._stage_event(stage)
+        event.wait(timeout)
+        return stage in self._stages_reached
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "description": self.description,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class IngestQueue:
+    """Bounded worker pool that runs ingestion jobs in submission order per user.
+
+    Different users are processed in parallel; jobs for the same user never run
+    concurrently, so uploads are indexed in the order they landed.
+    """
+    def __init__(self, workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._jobs = {}  # job_id -> IngestJob
+        self._user_jobs = {}  # user_email -> deque of pending jobs
+        self._active_users = set()
+        self._ready = queue.Queue()  # users with pending jobs and no running job
+        self._pending = 0
+        self._threads = []
+
+    def _ensure_workers(self):
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"ingest-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job_id, user_email, task, description=""):
+        """Queue task(job) for a user; resubmitting a known job ID returns the existing job"""
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.status != "failed":
+                return existing
+            if self._pending >= self.max_pending:
+                raise IngestQueueFull(f"Ingestion queue full ({self._pending} pending jobs)")
+
+            job = IngestJob(job_id, user_email, task, description)
+            self._jobs[job_id] = job
+            self._pending += 1
+            self._user_jobs.setdefault(user_email, deque()).append(job)
+            if user_email not in self._active_users:
+                self._active_users.add(user_email)
+                self._ready.put(user_email)
+            self._ensure_workers()
+        logging.info(f"Queued ingestion job {job_id} for user {user_email}: {description}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id):
+        """Forget a finished job so its ID can be submitted again"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished.is_set():
+                del self._jobs[job_id]
+
+    def _run(self):
+        while True:
+            user_email = self._ready.get()
+            with self._lock:
+                job = self._user_jobs[user_email].popleft()
+
+            job.status = "running"
+            job.updated_at = time.time()
+            try:
+                job.task(job)
+                job.finish("done")
+            except Exception as e:
+                logging.error(f"Ingestion job {job.job_id} failed: {e}")
+                job.finish("failed", str(e))
+
+            with self._lock:
+                self._pending -= 1
+                if self._user_jobs[user_email]:
+                    self._ready.put(user_email)
+                else:
+                    del self._user_jobs[user_email]
+                    self._active_users.discard(user_email)
+
+    def prune(self, max_age_hours=INGEST_JOB_TTL_HOURS):
+        """Forget finished jobs older than max_age_hours"""
+        cutoff = time.time() - max_age_hours * 3600
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished.is_set() and job.updated_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "active_users": len(self._active_users),
+                "workers": self.workers,
+                "tracked_jobs": len(self._jobs),
+            }
+
+
+# Global ingestion queue shared by upload handlers and the RAG registry
+ingest_queue = IngestQueue()
@@ -0,0 +1,52 @@
+class JSONObjectStream:
+    """Collects streamed model output and detects when its first JSON object is complete.
+
+    Brackets are counted outside strings only (tracking escapes), so a brace
+    inside a string value doesn't end the object. Text before the opening
+    brace is skipped; anything after the closing one is never looked at, so
+    the caller can stop the generation there.
+    """
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text):
+        """Add the next piece of output; returns True once the object is complete"""
+        if self.complete:
+            return True
+        if not self.started:
+            start = text.find("{")
+            if start < 0:
+                return False
+            self.started = True
+            text = text[start:]
+
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[:i + 1])
+                    self.complete = True
+                    return True
+        self._parts.append(text)
+        return False
+
+    @property
+    def text(self):
+        """The object's text so far, from its opening brace"""
+        return "".join(self._parts)
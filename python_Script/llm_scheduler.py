@@ -0,0 +1,255 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+import numpy as np
+
+# Priority classes, most urgent first: streamed chat answers, document analyses,
+# insights, then background work such as conversation summaries and model preloads
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DOCUMENT = 1
+PRIORITY_INSIGHT = 2
+PRIORITY_BACKGROUND = 3
+PRIORITY_NAMES = ("interactive", "document", "insight", "background")
+
+# LLM calls running at once per backend; match the server's OLLAMA_NUM_PARALLEL
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# Calls waiting for a slot; beyond this the least urgent waiter (or the new call) is rejected with 429
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+# Longest a call may wait for a slot, per priority class, before it is shed with 503
+LLM_QUEUE_DEADLINES = (
+    float(os.getenv("LLM_QUEUE_DEADLINE_INTERACTIVE", "15")),
+    float(os.getenv("LLM_QUEUE_DEADLINE_DOCUMENT", "60")),
+    float(os.getenv("LLM_QUEUE_DEADLINE_INSIGHT", "30")),
+    float(os.getenv("LLM_QUEUE_DEADLINE_BACKGROUND", "300")),
+)
+# Wait-time samples kept for the percentiles
+SCHEDULER_STATS_SAMPLES = 1024
+
+
+class LLMOverloaded(Exception):
+    """Raised when a call is not admitted: status 429 when the queue is full, 503 when it would miss its deadline"""
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class Slot:
+    """Permission to run one LLM call; release() is idempotent so every exit path can call it"""
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.started = time.monotonic()
+        self._released = False
+
+    @property
+    def backend(self):
+        """The backend whose scheduler granted this slot"""
+        return self.scheduler.owner
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self)
+
+    def _take_over(self, moved):
+        self.release()
+        self.scheduler, self.started, self._released = moved.scheduler, moved.started, False
+
+    def transfer(self, scheduler):
+        """Move the slot to another scheduler, for a call failing over to another backend; raises LLMOverloaded"""
+        self._take_over(scheduler.acquire(self.priority))
+
+    async def transfer_async(self, scheduler):
+        self._take_over(await scheduler.acquire_async(self.priority))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "enqueued", "notify", "granted", "cancelled", "error")
+
+    def __init__(self, priority, seq, notify):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.notify = notify
+        self.granted = False
+        self.cancelled = False
+        self.error = None
+
+
+class LLMScheduler:
+    """Admission control in front of one LLM backend.
+
+    At most max_in_flight calls run at once; the rest wait in a priority queue
+    (FIFO within a priority) and are granted slots most urgent first. A call
+    is shed with 503 as soon as the queue ahead of it cannot drain within its
+    deadline, judged from the average slot hold time, or when the deadline
+    passes; a full queue rejects the least urgent call with 429. Threads wait
+    on acquire(), coroutines on acquire_async().
+    """
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, max_queue=LLM_MAX_QUEUE, deadlines=LLM_QUEUE_DEADLINES,
+                 owner=None):
+        self.owner = owner
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.deadlines = deadlines
+        self.in_flight = 0
+        self._queue = []  # heap of (priority, seq, waiter); cancelled waiters are skipped when popped
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._hold_seconds = None  # moving average of how long a call holds its slot
+        self.admitted = [0] * len(PRIORITY_NAMES)
+        self.rejected = [0] * len(PRIORITY_NAMES)
+        self.shed = [0] * len(PRIORITY_NAMES)
+        self._waits = [deque(maxlen=SCHEDULER_STATS_SAMPLES) for _ in PRIORITY_NAMES]
+
+    def load(self):
+        """Running plus waiting calls per slot; 1.0 means every slot is busy and nothing is queued"""
+        return (self.in_flight + self._waiting) / self.max_in_flight
+
+    def _live_waiters(self):
+        return [waiter for _, _, waiter in self._queue if not waiter.cancelled]
+
+    def _admit(self, priority, notify):
+        """Return a Slot if one is free for this priority, else a queued _Waiter; raises LLMOverloaded"""
+        with self._lock:
+            waiters = self._live_waiters()
+            ahead = sum(1 for waiter in waiters if waiter.priority <= priority)
+            if self.in_flight < self.max_in_flight and not ahead:
+                self.in_flight += 1
+                self.admitted[priority] += 1
+                self._waits[priority].append(0.0)
+                return Slot(self, priority)
+
+            # Shed now rather than after the deadline when the calls ahead clearly won't drain in time
+            if self._hold_seconds is not None:
+                expected_wait = (ahead + 1) / self.max_in_flight * self._hold_seconds
+                if expected_wait > self.deadlines[priority]:
+                    self.shed[priority] += 1
+                    raise LLMOverloaded("The model server is busy, please retry shortly", 503)
+
+            if self._waiting >= self.max_queue:
+                worst = max(waiters, key=lambda waiter: (waiter.priority, waiter.seq))
+                if worst.priority <= priority:
+                    self.rejected[priority] += 1
+                    raise LLMOverloaded("Too many requests are waiting for the model, please retry shortly", 429)
+                # Make room by turning away the least urgent, most recently queued call
+                self._cancel(worst)
+                self.rejected[worst.priority] += 1
+                worst.error = LLMOverloaded("Too many requests are waiting for the model, please retry shortly", 429)
+                worst.notify()
+
+            waiter = _Waiter(priority, next(self._seq), notify)
+            heapq.heappush(self._queue, (priority, waiter.seq, waiter))
+            self._waiting += 1
+            return waiter
+
+    def _cancel(self, waiter):
+        waiter.cancelled = True
+        self._waiting -= 1
+
+    def _timed_out(self, waiter):
+        """Called when a waiter's deadline passed; returns True if it was shed, False if it got a slot meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return False
+            if not waiter.cancelled:
+                self._cancel(waiter)
+                self.shed[waiter.priority] += 1
+            return True
+
+    def _grant_next(self):
+        while self.in_flight < self.max_in_flight and self._queue:
+            _, _, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            self._waiting -= 1
+            waiter.granted = True
+            self.in_flight += 1
+            self.admitted[waiter.priority] += 1
+            self._waits[waiter.priority].append(time.monotonic() - waiter.enqueued)
+            waiter.notify()
+
+    def _release(self, slot):
+        held = time.monotonic() - slot.started
+        with self._lock:
+            self.in_flight -= 1
+            self._hold_seconds = held if self._hold_seconds is None else 0.9 * self._hold_seconds + 0.1 * held
+            self._grant_next()
+
+    def _return_unused(self):
+        """Hand back a slot granted to a waiter that no longer wants it"""
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_next()
+
+    def _result(self, waiter, priority):
+        if waiter.error is not None:
+            raise waiter.error
+        return Slot(self, priority)
+
+    def acquire(self, priority):
+        """Block until a slot is granted; raises LLMOverloaded when shed or rejected"""
+        event = threading.Event()
+        admitted = self._admit(priority, event.set)
+        if isinstance(admitted, Slot):
+            return admitted
+        if not event.wait(self.deadlines[priority]) and self._timed_out(admitted):
+            raise LLMOverloaded("The model server is busy, please retry shortly", 503)
+        return self._result(admitted, priority)
+
+    async def acquire_async(self, priority):
+        """acquire() for coroutines: waits on the event loop instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        admitted = self._admit(priority, notify)
+        if isinstance(admitted, Slot):
+            return admitted
+        try:
+            await asyncio.wait_for(granted, self.deadlines[priority])
+        except asyncio.TimeoutError:
+            if self._timed_out(admitted):
+                raise LLMOverloaded("The model server is busy, please retry shortly", 503)
+        except asyncio.CancelledError:
+            # The client went away while queued: give up the place, or the slot if it was just granted
+            if not self._timed_out(admitted) and admitted.error is None:
+                self._return_unused()
+            raise
+        return self._result(admitted, priority)
+
+    def stats(self):
+        with self._lock:
+            waiters = self._live_waiters()
+            by_priority = {}
+            for priority, name in enumerate(PRIORITY_NAMES):
+                waits = self._waits[priority]
+                by_priority[name] = {
+                    "queued": sum(1 for waiter in waiters if waiter.priority == priority),
+                    "admitted": self.admitted[priority],
+                    "rejected_429": self.rejected[priority],
+                    "shed_503": self.shed[priority],
+                    "wait_ms": {"p50": round(float(np.percentile(waits, 50)) * 1000, 1),
+                                "p95": round(float(np.percentile(waits, 95)) * 1000, 1)} if waits else None,
+                }
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": len(waiters),
+                "avg_hold_ms": round(self._hold_seconds * 1000, 1) if self._hold_seconds is not None else None,
+                "priorities": by_priority,
+            }
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+try:
+    from .model_routing import task_models
+except ImportError:  # run from python_Script rather than imported as a package
+    from model_routing import task_models
+
+# How long Ollama keeps a model loaded after its last request ("30m", "1h", "-1" for indefinitely).
+# Sent with every call, since Ollama resets a model's timer to the keep_alive of each request
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Per-model overrides, e.g. "gemma3:1b=-1,llama3.2:3b=10m"
+OLLAMA_KEEP_ALIVE_MODELS = os.getenv("OLLAMA_KEEP_ALIVE_MODELS", "")
+# Models loaded when the app starts, so the first user after a deploy doesn't pay the load;
+# by default every model a task is routed to once the backends' pulled models are known
+OLLAMA_PRELOAD_MODELS = os.getenv("OLLAMA_PRELOAD_MODELS")
+# Context window sent with every call (0 leaves the server default). Ollama reloads a model
+# whenever num_ctx changes between requests, so it must not vary per call
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))
+
+# A load_duration above this means the call had to load the model rather than find it resident
+COLD_LOAD_SECONDS = 0.5
+# Latency samples kept per model for the percentiles
+MODEL_STATS_SAMPLES = 1024
+
+
+def _parse_keep_alive_overrides(spec):
+    overrides = {}
+    for entry in spec.split(","):
+        if "=" in entry:
+            model, keep_alive = entry.rsplit("=", 1)
+            overrides[model.strip()] = keep_alive.strip()
+    return overrides
+
+
+KEEP_ALIVE_OVERRIDES = _parse_keep_alive_overrides(OLLAMA_KEEP_ALIVE_MODELS)
+
+
+def keep_alive_for(model):
+    keep_alive = KEEP_ALIVE_OVERRIDES.get(model, OLLAMA_KEEP_ALIVE)
+    # Ollama reads bare numbers as seconds, and needs them as numbers rather than strings
+    try:
+        return int(keep_alive)
+    except ValueError:
+        return keep_alive
+
+
+def preload_models():
+    if OLLAMA_PRELOAD_MODELS is None:
+        return task_models()
+    return [model.strip() for model in OLLAMA_PRELOAD_MODELS.split(",") if model.strip()]
+
+
+def with_residency(payload):
+    """Add the model's keep_alive and the fixed context window to a request payload"""
+    payload = {**payload}
+    payload.setdefault("keep_alive", keep_alive_for(payload.get("model")))
+    if OLLAMA_NUM_CTX:
+        payload["options"] = {"num_ctx": OLLAMA_NUM_CTX, **payload.get("options", {})}
+    return payload
+
+
+class ModelStats:
+    """Per-model latency counters fed from every Ollama response.
+
+    Time to first token is measured on streamed calls. Ollama's own timings
+    in the final chunk separate model loads (load_duration) from prompt
+    evaluation; prompt_eval_count only counts tokens not served from the
+    server's cache, so it drops when a conversation's prompt prefix is reused.
+    """
+    def __init__(self, samples=MODEL_STATS_SAMPLES):
+        self.samples = samples
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model):
+        if model not in self._models:
+            self._models[model] = {
+                "requests": 0,
+                "cold_loads": 0,
+                "ttft": deque(maxlen=self.samples),
+                "load": deque(maxlen=self.samples),
+                "prompt_eval_tokens": deque(maxlen=self.samples),
+                "prompt_eval": deque(maxlen=self.samples),
+            }
+        return self._models[model]
+
+    def record(self, model, final_chunk, ttft=None):
+        """Record one finished call from its final response chunk; ttft in seconds for streamed calls"""
+        load = final_chunk.get("load_duration", 0) / 1e9
+        with self._lock:
+            stats = self._model(model)
+            stats["requests"] += 1
+            if load > COLD_LOAD_SECONDS:
+                stats["cold_loads"] += 1
+            if ttft is not None:
+                stats["ttft"].append(ttft)
+            stats["load"].append(load)
+            stats["prompt_eval_tokens"].append(final_chunk.get("prompt_eval_count", 0))
+            stats["prompt_eval"].append(final_chunk.get("prompt_eval_duration", 0) / 1e9)
+
+    @staticmethod
+    def _percentiles(values, scale=1000):
+        if not values:
+            return None
+        p50, p95 = np.percentile(np.asarray(values), [50, 95])
+        return {"p50": round(float(p50) * scale, 1), "p95": round(float(p95) * scale, 1)}
+
+    def stats(self):
+        with self._lock:
+            return {model: {
+                "requests": stats["requests"],
+                "cold_loads": stats["cold_loads"],
+                "ttft_ms": self._percentiles(stats["ttft"]),
+                "load_ms": self._percentiles(stats["load"]),
+                "prompt_eval_ms": self._percentiles(stats["prompt_eval"]),
+                "prompt_eval_tokens": self._percentiles(stats["prompt_eval_tokens"], scale=1),
+            } for model, stats in self._models.items()}
+
+
+model_stats = ModelStats()
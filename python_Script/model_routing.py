@@ -0,0 +1,90 @@
+import os
+import logging
+
+# Model and generation options per LLM task. Each task reads <TASK>_MODEL, <TASK>_NUM_PREDICT and
+# <TASK>_TEMPERATURE, e.g. INSIGHTS_MODEL=gemma3:270m INSIGHTS_NUM_PREDICT=320; an empty
+# NUM_PREDICT or TEMPERATURE leaves the model's own default. Short structured tasks run on a
+# small model with a tight output cap, leaving the large model's capacity to interactive chat.
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+# Default model of the short structured tasks; they fall back to OLLAMA_MODEL while no backend has it pulled
+OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", "gemma3:270m")
+
+#   chat       streamed answers to the user's messages
+#   document   streamed analysis of an uploaded document
+#   insights   the JSON health insights sent with each answer
+#   summary    folding old turns into a conversation's running summary
+TASK_DEFAULTS = {
+    "chat": (OLLAMA_MODEL, "", ""),
+    "document": (OLLAMA_MODEL, "", ""),
+    # Two insights of up to ollamatry.INSIGHT_CONTENT_CHARS each in English; scaled per reply language below
+    "insights": (OLLAMA_SMALL_MODEL, "320", "0.2"),
+    "summary": (OLLAMA_SMALL_MODEL, os.getenv("CHAT_SUMMARY_TOKENS", "256"), "0.2"),
+}
+
+# Output tokens per character relative to English, by reply language, e.g. "tamil=3,hindi=2". Indic
+# scripts take several times more tokens for the same text, so a task's num_predict is scaled by
+# this factor; otherwise the cap cuts a JSON reply off before its closing brace
+LANGUAGE_TOKEN_FACTORS = {
+    language.strip().lower(): float(factor)
+    for language, factor in (entry.split("=", 1) for entry in
+                             os.getenv("LANGUAGE_TOKEN_FACTORS", "tamil=3,hindi=2").split(",") if "=" in entry)
+}
+
+
+def _task_config(task, model, num_predict, temperature):
+    prefix = task.upper()
+    num_predict = os.getenv(f"{prefix}_NUM_PREDICT", num_predict)
+    temperature = os.getenv(f"{prefix}_TEMPERATURE", temperature)
+    options = {}
+    if num_predict:
+        options["num_predict"] = int(num_predict)
+    if temperature:
+        options["temperature"] = float(temperature)
+    return {"model": os.getenv(f"{prefix}_MODEL", model), "options": options}
+
+
+TASKS = {task: _task_config(task, *defaults) for task, defaults in TASK_DEFAULTS.items()}
+
+_available_models = None  # models pulled on any backend, from the client's health checks; None until known
+_missing_logged = set()
+
+
+def _full_name(model):
+    return model if ":" in model else f"{model}:latest"
+
+
+def set_available_models(models):
+    """Record the models the backends have pulled (from /api/tags)"""
+    global _available_models
+    _available_models = {_full_name(model) for model in models}
+
+
+def task_model(task):
+    """The task's model, or OLLAMA_MODEL while no backend has the task's model pulled"""
+    model = TASKS[task]["model"]
+    if _available_models is None or _full_name(model) in _available_models:
+        return model
+    if model not in _missing_logged:
+        _missing_logged.add(model)
+        logging.warning(f"Model {model} for the {task} task is not pulled on any Ollama backend, using {OLLAMA_MODEL}")
+    return OLLAMA_MODEL
+
+
+def task_models():
+    """Every model some task runs on, once each"""
+    return list(dict.fromkeys(task_model(task) for task in TASKS))
+
+
+def task_payload(task, messages, model=None, language=None):
+    """A /chat payload for a task: its model (unless overridden), its generation options and the messages.
+
+    With the reply language, the task's num_predict is scaled by LANGUAGE_TOKEN_FACTORS.
+    """
+    config = TASKS[task]
+    payload = {"model": model or task_model(task), "messages": messages}
+    if config["options"]:
+        options = dict(config["options"])
+        if language and "num_predict" in options:
+            options["num_predict"] = int(options["num_predict"] * LANGUAGE_TOKEN_FACTORS.get(language.lower(), 1))
+        payload["options"] = options
+    return payload
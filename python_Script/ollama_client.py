@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Imported after load_dotenv, since it reads its settings from the environment on import
+try:
+    from .model_residency import model_stats, with_residency
+    from .llm_scheduler import LLMScheduler, LLMOverloaded, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from .model_routing import set_available_models
+except ImportError:  # run from python_Script rather than imported as a package
+    from model_residency import model_stats, with_residency
+    from llm_scheduler import LLMScheduler, LLMOverloaded, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from model_routing import set_available_models
+
+# One or more Ollama servers, comma-separated; calls are spread across them
+OLLAMA_API_URLS = [url.strip() for url in os.getenv("OLLAMA_API_URL", "http://localhost:11434/api").split(",")
+                   if url.strip()]
+
+# Connections kept open to Ollama; should cover the server's worker threads
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+# Seconds to establish a connection, and to wait for the next bytes of a response.
+# A non-streaming call only answers once the whole reply is generated, so the read timeout is generous
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+# Retries of idempotent calls after connection failures and 502/503/504, with jittered exponential backoff
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))
+# Consecutive failures that open the circuit, and seconds before a probe call is let through
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "5"))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30"))
+# Seconds between health checks of each backend, and the read timeout of a check
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "5"))
+# A session stays on the backend holding its cached prompt prefix unless that backend is busier than
+# the least-loaded one by more than this (in calls per slot, so 1 is a full extra round of calls)
+OLLAMA_AFFINITY_SLACK = float(os.getenv("OLLAMA_AFFINITY_SLACK", "1"))
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+class OllamaError(Exception):
+    """Raised when an Ollama call fails or returns an error status"""
+
+
+class OllamaUnavailable(OllamaError):
+    """Raised without calling Ollama while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated errors instead of letting each one wait out its timeouts.
+
+    closed -> open after `threshold` consecutive failures; once `cooldown`
+    seconds have passed a single probe call is let through (half-open), and
+    its outcome closes the circuit again or restarts the cooldown.
+    """
+    def __init__(self, threshold=OLLAMA_BREAKER_THRESHOLD, cooldown=OLLAMA_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether allow() would let a call through, without starting a probe"""
+        with self._lock:
+            return self.state == "closed" or (
+                self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown)
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logging.warning(f"Ollama circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.times_opened}
+
+
+class OllamaBackend:
+    """One Ollama server, with its own circuit breaker, scheduler and health flag"""
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker()
+        self.scheduler = LLMScheduler(owner=self)
+        self.healthy = True  # result of the last health check
+        self.failovers = 0  # calls moved to another backend after failing here
+
+    def available(self):
+        return self.healthy and self.breaker.available()
+
+    def load(self):
+        return self.scheduler.load()
+
+    def stats(self):
+        return {"base_url": self.base_url, "healthy": self.healthy, "failovers": self.failovers,
+                "circuit": self.breaker.stats(), "scheduler": self.scheduler.stats()}
+
+
+class OllamaPool:
+    """The Ollama backends calls are routed across.
+
+    A call goes to the least-loaded available backend (passing its health
+    checks, circuit not open), by running plus queued calls per slot. Calls
+    with an affinity key, the chat session, prefer the backend the key
+    hashes to, so a conversation keeps reusing the prompt prefix that server
+    has cached, unless it is much busier than the least-loaded backend. If
+    no backend is available the least-loaded one is used anyway and its
+    circuit breaker decides.
+    """
+    def __init__(self, urls=OLLAMA_API_URLS):
+        self.backends = [OllamaBackend(url) for url in urls]
+
+    def pick(self, affinity=None, exclude=()):
+        """The backend for a call, or None if every backend is excluded"""
+        candidates = [backend for backend in self.backends if backend not in exclude]
+        if not candidates:
+            return None
+        candidates = [backend for backend in candidates if backend.available()] or candidates
+        # Random tie-break, so idle backends share the calls
+        least = min(candidates, key=lambda backend: (backend.load(), random.random()))
+        if affinity is None:
+            return least
+        # Rendezvous hashing: a backend dropping out only moves the sessions that were on it
+        preferred = max(candidates, key=lambda backend: hashlib.sha256(
+            f"{affinity}|{backend.base_url}".encode("utf-8")).digest())
+        return preferred if preferred.load() <= least.load() + OLLAMA_AFFINITY_SLACK else least
+
+    def admit(self, priority, affinity=None):
+        """Pick a backend and take a slot from its scheduler; raises LLMOverloaded when the call is shed"""
+        return self.pick(affinity).scheduler.acquire(priority)
+
+    async def admit_async(self, priority, affinity=None):
+        return await self.pick(affinity).scheduler.acquire_async(priority)
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+
+class OllamaClient:
+    """Process-wide HTTP client for the Ollama API.
+
+    One requests.Session with a pooled adapter keeps connections alive across
+    calls and threads. Every call has connect/read timeouts; idempotent calls
+    are retried a bounded number of times with jittered backoff, and each
+    backend has its own circuit breaker. Model calls (chat, stream_chat,
+    load) first take a slot from a backend's scheduler, which caps how many
+    run on that server at once and hands out free slots by priority.
+    """
+    def __init__(self, pool=None, pool_size=OLLAMA_POOL_SIZE,
+                 timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT), max_retries=OLLAMA_MAX_RETRIES):
+        self.pool = pool or OllamaPool()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # Retries are handled here, where they can respect idempotency and the breaker
+        adapter = HTTPAdapter(pool_connections=len(self.pool.backends), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.retries = 0
+
+    def _failover(self, tried, slot):
+        """Another available backend for a retry, with the call's slot moved to it, or None"""
+        backend = self.pool.pick(exclude=tried)
+        if backend is None or not backend.available():
+            return None
+        if slot is not None:
+            try:
+                slot.transfer(backend.scheduler)
+            except LLMOverloaded:
+                return None
+        tried[-1].failovers += 1
+        logging.warning(f"Ollama call failing over from {tried[-1].base_url} to {backend.base_url}")
+        return backend
+
+    def request(self, method, path, idempotent=True, slot=None, **kwargs):
+        """Send a request and return the response once its headers arrive (status 200).
+
+        The call goes to the backend of its scheduler slot, or the least-loaded
+        one. Only idempotent calls are retried, and only on failures where
+        Ollama cannot have started on the request: connection errors, connect
+        timeouts and 502/503/504. A read timeout is never retried. With several
+        backends a retry fails over to another available one, taking the slot
+        along, instead of waiting to retry the same server.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = self.max_retries + 1 if idempotent else 1
+        backend = slot.backend if slot is not None else self.pool.pick()
+        tried = [backend]
+        for attempt in range(attempts):
+            if not backend.breaker.allow():
+                raise OllamaUnavailable(f"Ollama at {backend.base_url} is unavailable, please retry shortly")
+            retryable = False
+            try:
+                response = self.session.request(method, f"{backend.base_url}{path}", **kwargs)
+            except requests.RequestException as e:
+                backend.breaker.record_failure()
+                retryable = isinstance(e, requests.ConnectionError) and not isinstance(e, requests.ReadTimeout)
+                error = OllamaError(f"Ollama request to {backend.base_url}{path} failed: {e}")
+            else:
+                if response.status_code == 200:
+                    backend.breaker.record_success()
+                    return response
+                if response.status_code >= 500:
+                    backend.breaker.record_failure()
+                else:
+                    backend.breaker.record_success()
+                retryable = response.status_code in RETRY_STATUSES
+                logging.error(f"Ollama API error: {response.text}")
+                response.close()
+                error = OllamaError(f"Ollama API returned status {response.status_code}")
+            if not retryable or attempt == attempts - 1:
+                raise error
+            self.retries += 1
+            failover = self._failover(tried, slot)
+            if failover is not None:
+                backend = failover
+                tried.append(backend)
+            else:
+                # Full jitter keeps threads that failed together from retrying together
+                time.sleep(random.uniform(0, OLLAMA_RETRY_BACKOFF * 2 ** attempt))
+
+    def admit(self, priority, affinity=None):
+        """Take a scheduler slot for a model call on the backend chosen for it; raises LLMOverloaded
+        when the call is shed"""
+        return self.pool.admit(priority, affinity)
+
+    def chat(self, payload, priority=PRIORITY_INTERACTIVE, affinity=None):
+        """Non-streaming /chat call; returns the decoded response"""
+        with self.admit(priority, affinity) as slot:
+            response = self.request("POST", "/chat", slot=slot,
+                                    json=with_residency({**payload, "stream": False}))
+            try:
+                result = response.json()
+            except ValueError as e:
+                raise OllamaError(f"Invalid response from Ollama: {e}")
+        model_stats.record(payload.get("model"), result)
+        return result
+
+    def stream_chat(self, payload, priority=PRIORITY_INTERACTIVE, slot=None):
+        """Streaming /chat call; yields each decoded NDJSON chunk.
+
+        The scheduler slot (taken here, or passed in by a caller that admitted
+        the call earlier) is held until the stream ends. The connection goes
+        back to the pool when the stream ends or the consumer stops early. A
+        stall longer than the read timeout raises OllamaError and counts
+        against the circuit breaker.
+        """
+        slot = slot or self.admit(priority)
+        start = time.monotonic()
+        ttft = None
+        with slot:
+            response = self.request("POST", "/chat", slot=slot, stream=True,
+                                    json=with_residency({**payload, "stream": True}))
+            with response:
+                try:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        try:
+                            chunk = json.loads(line)
+                        except json.JSONDecodeError:
+                            logging.error(f"Failed to parse JSON from stream: {line}")
+                            continue
+                        if ttft is None and chunk.get("message", {}).get("content"):
+                            ttft = time.monotonic() - start
+                        if chunk.get("done"):
+                            model_stats.record(payload.get("model"), chunk, ttft)
+                        yield chunk
+                except requests.RequestException as e:
+                    slot.backend.breaker.record_failure()
+                    raise OllamaError(f"Ollama stream interrupted: {e}")
+
+    def load(self, model):
+        """Load a model into memory on every backend without generating anything, with its keep_alive"""
+        error = None
+        for backend in self.pool.backends:
+            try:
+                with backend.scheduler.acquire(PRIORITY_BACKGROUND) as slot:
+                    self.request("POST", "/chat", idempotent=False, slot=slot,
+                                 json=with_residency({"model": model, "messages": [], "stream": False})).close()
+            except (OllamaError, LLMOverloaded) as e:
+                error = e
+        if error is not None:
+            raise error
+
+    def check_health(self):
+        """Probe every backend, update its health flag and report the pulled models to model routing"""
+        models = set()
+        for backend in self.pool.backends:
+            try:
+                with self.session.get(f"{backend.base_url}/tags",
+                                      timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_HEALTH_TIMEOUT)) as response:
+                    healthy = response.status_code == 200
+                    if healthy:
+                        models.update(model["name"] for model in response.json().get("models", []))
+            except (requests.RequestException, ValueError):
+                healthy = False
+            if healthy != backend.healthy:
+                logging.warning(f"Ollama backend {backend.base_url} is {'healthy' if healthy else 'unhealthy'}")
+            backend.healthy = healthy
+        if any(backend.healthy for backend in self.pool.backends):
+            set_available_models(models)
+
+    def start_health_checks(self, interval=OLLAMA_HEALTH_INTERVAL):
+        def run():
+            while True:
+                self.check_health()
+                time.sleep(interval)
+        threading.Thread(target=run, daemon=True, name="ollama-health").start()
+
+    def stats(self):
+        return {"retries": self.retries, "backends": self.pool.stats()}
+
+
+# Single shared client for the whole process
+ollama_client = OllamaClient()
@@ -5,6 +5,7 @@ from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from datetime import datetime, timedelta, timezone
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 import logging
 import json
@@ -21,15 +22,20 @@ from functools import wraps
 import jwt
 from datetime import datetime, timedelta
 import io
-import requests as http_requests  # Renamed to avoid conflict with google.auth.transport.requests
-import pickle
-
-# Add these new imports for RAG
-from sentence_transformers import SentenceTransformer
-import numpy as np
-import faiss
-import glob
-import re
+import hashlib
+from contextlib import closing
+
+# RAG manager and the process-wide registry of per-user managers
+from rag_manager import rag_registry, BASE_DATA_DIR
+from embedding_service import embedding_service
+from ingest_queue import ingest_queue, IngestQueueFull
+from query_cache import LRUCache, query_embedding_cache, retrieval_cache
+from ollama_client import ollama_client, OllamaError
+from llm_scheduler import LLMOverloaded, PRIORITY_INTERACTIVE, PRIORITY_DOCUMENT, PRIORITY_INSIGHT
+from model_routing import task_model, task_payload
+from conversation_memory import ConversationMemory
+from model_residency import model_stats, preload_models
+from json_stream import JSONObjectStream
 
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
@@ -44,9 +50,8 @@ app.secret_key = os.urandom(24)
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Ollama API configuration
-OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma3:1b")
+# Ollama API configuration (the API URL and connection settings live in ollama_client,
+# the model and generation options of each task in model_routing)
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
@@ -58,7 +63,6 @@ os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
 
 # Base directory for user data
-BASE_DATA_DIR = os.path.join(os.getcwd(), "AAA")
 os.makedirs(BASE_DATA_DIR, exist_ok=True)
 
 # Global session store
@@ -67,65 +71,94 @@ SESSION_EXPIRATION_HOURS = 24
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'txt'}
 
-# Add RAG configuration
-EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
-INDEX_DIMENSIONS = 384  # Dimensions of the embeddings from all-MiniLM-L6-v2
-CHUNK_SIZE = 500
-CHUNK_OVERLAP = 100
+# How long an upload request waits for background text extraction before answering 202
+INGEST_EXTRACT_TIMEOUT = int(os.getenv("INGEST_EXTRACT_TIMEOUT", "120"))
+
+# "parallel" generates insights alongside the streamed answer and sends them in the final frame;
+# "detached" sends the final frame as soon as the answer ends and serves insights from /insights/<session_id>
+INSIGHTS_MODE = os.getenv("INSIGHTS_MODE", "parallel")
+INSIGHT_WORKERS = int(os.getenv("INSIGHT_WORKERS", "8"))
+# How long GET /insights waits for pending insights before answering 202
+INSIGHT_WAIT_TIMEOUT = int(os.getenv("INSIGHT_WAIT_TIMEOUT", "30"))
+insight_executor = ThreadPoolExecutor(max_workers=INSIGHT_WORKERS, thread_name_prefix="insights")
+
+# Stateless insights send only the insight system prompt and the current conversation window, and are
+# cached by request across sessions; "false" keeps each session's insight_chat history in the request
+INSIGHTS_STATELESS = os.getenv("INSIGHTS_STATELESS", "true").lower() == "true"
+INSIGHT_CACHE_SIZE = int(os.getenv("INSIGHT_CACHE_SIZE", "1024"))
+insight_cache = LRUCache(INSIGHT_CACHE_SIZE)
+
+# Output constraint for stateless insight calls: "schema" has Ollama generate only JSON matching
+# INSIGHT_SCHEMA, "json" any JSON object (for servers before Ollama 0.5), "none" leaves the model free
+INSIGHTS_FORMAT = os.getenv("INSIGHTS_FORMAT", "schema")
+# Length cap of each insight's content; the insights task's num_predict must cover two of them
+INSIGHT_CONTENT_CHARS = 240
+INSIGHT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "insights": {
+            "type": "array",
+            "minItems": 2,
+            "maxItems": 2,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": ["recommendation", "trend"]},
+                    "content": {"type": "string", "maxLength": INSIGHT_CONTENT_CHARS},
+                    "severity": {"type": "string", "enum": ["low", "medium", "high"]}
+                },
+                "required": ["type", "content", "severity"]
+            }
+        }
+    },
+    "required": ["insights"]
+}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 class OllamaChat:
-    """Wrapper class for Ollama chat capabilities with streaming support"""
-    def __init__(self, model=OLLAMA_MODEL, system_instruction=""):
-        self.model = model
+    """Wrapper class for Ollama chat capabilities with streaming support, for one task's model"""
+    def __init__(self, task="chat", system_instruction=""):
+        self.task = task
         self.system = system_instruction
-        self.history = []
+        self.memory = ConversationMemory()
+    
+    @property
+    def model(self):
+        return task_model(self.task)
+    
+    @property
+    def history(self):
+        """Recent messages not yet folded into the conversation summary"""
+        return self.memory.history
     
     def start_chat(self, history=None):
         if history is not None:
-            self.history = history
+            self.memory = ConversationMemory(history=history)
         return self
     
-    def send_message(self, message):
+    def build_messages(self, message):
+        """Messages for Ollama's chat API: system prompt, conversation summary, recent history
+        and the new message, within the prompt token budget"""
+        return self.memory.build(self.system, message)
+    
+    def payload(self, messages, task=None, language=None):
+        """A /chat payload with the model and generation options of this chat's task, or another task"""
+        return task_payload(task or self.task, messages, language=language)
+    
+    def record(self, message, response_text):
+        """Append a completed exchange to the history"""
+        self.memory.add(message, response_text)
+    
+    def send_message(self, message, priority=PRIORITY_INTERACTIVE, language=None):
         """Send message to Ollama API and get response (non-streaming)"""
-        messages = []
-        
-        # Add system message if available
-        if self.system:
-            messages.append({"role": "system", "content": self.system})
-        
-        # Add conversation history
-        for entry in self.history:
-            if entry["role"] == "user":
-                messages.append({"role": "user", "content": entry["content"]})
-            else:
-                messages.append({"role": "assistant", "content": entry["content"]})
-        
-        # Add current message
-        messages.append({"role": "user", "content": message})
-        
-        # Make API call to Ollama
-        response = http_requests.post(
-            f"{OLLAMA_API_URL}/chat",
-            json={
-                "model": self.model,
-                "messages": messages,
-                "stream": False
-            }
-        )
-        
-        if response.status_code != 200:
-            logging.error(f"Ollama API error: {response.text}")
-            raise Exception(f"Ollama API returned status {response.status_code}")
-        
-        result = response.json()
+        # Make API call to Ollama over the shared pooled client
+        result = ollama_client.chat(self.payload(self.build_messages(message), language=language), priority=priority)
         response_text = result["message"]["content"]
         
         # Update history
-        self.history.append({"role": "user", "content": message})
-        self.history.append({"role": "assistant", "content": response_text})
+        self.record(message, response_text)
         
         # Create a response object with text property to match Gemini API
         class ResponseObj:
@@ -134,370 +167,6 @@ class OllamaChat:
         
         return ResponseObj(response_text)
     
-# Improved RAG Manager class with persistence
-class RAGManager:
-    """Manages retrieval-augmented generation for user-specific data with persistence"""
-    def __init__(self, user_email):
-        self.user_email = user_email
-        self.user_folder = os.path.join(BASE_DATA_DIR, user_email)
-        self.formilvus_folder = os.path.join(self.user_folder, "formilvus")
-        self.vectors_folder = os.path.join(self.user_folder, "vectors")
-        
-        # Create necessary directories
-        os.makedirs(self.formilvus_folder, exist_ok=True)
-        os.makedirs(self.vectors_folder, exist_ok=True)
-        
-        # Path for saving index and metadata
-        self.index_path = os.path.join(self.vectors_folder, "faiss_index.bin")
-        self.chunks_path = os.path.join(self.vectors_folder, "text_chunks.pkl")
-        self.metadata_path = os.path.join(self.vectors_folder, "metadata.json")
-        
-        # Load existing index and chunks if available
-        self.index = None
-        self.text_chunks = []
-        self._load_vectors()
-        
-        # Track files that have been processed
-        self.processed_files = self._load_metadata().get("processed_files", [])
-        
-        # Embedding model - loaded on demand
-        self.embedding_model = None
-        
-    def _get_embedding_model(self):
-        """Lazy loading of the embedding model"""
-        if self.embedding_model is None:
-            try:
-                self.embedding_model = SentenceTransformer(EMBEDDING_MODEL)
-                logging.info(f"Loaded embedding model for user {self.user_email}")
-            except Exception as e:
-                logging.error(f"Failed to load embedding model: {e}")
-                raise
-        return self.embedding_model
-    
-    def _load_vectors(self):
-        """Load existing FAISS index and text chunks if available"""
-        try:
-            if os.path.exists(self.index_path) and os.path.exists(self.chunks_path):
-                logging.info(f"Loading existing vector database for user {self.user_email}")
-                self.index = faiss.read_index(self.index_path)
-                
-                with open(self.chunks_path, 'rb') as f:
-                    self.text_chunks = pickle.load(f)
-                
-                logging.info(f"Loaded vector database with {len(self.text_chunks)} chunks for user {self.user_email}")
-                return True
-            else:
-                logging.info(f"No existing vector database found for user {self.user_email}")
-                return False
-        except Exception as e:
-            logging.error(f"Error loading vector database: {e}")
-            # Reset to defaults in case of error
-            self.index = None
-            self.text_chunks = []
-            return False
-    
-    def _save_vectors(self):
-        """Save FAISS index and text chunks to disk"""
-        try:
-            if self.index and self.text_chunks:
-                faiss.write_index(self.index, self.index_path)
-                
-                with open(self.chunks_path, 'wb') as f:
-                    pickle.dump(self.text_chunks, f)
-                
-                logging.info(f"Saved vector database with {len(self.text_chunks)} chunks for user {self.user_email}")
-                return True
-            return False
-        except Exception as e:
-            logging.error(f"Error saving vector database: {e}")
-            return False
-    
-    def _load_metadata(self):
-        """Load metadata about processed files"""
-        if os.path.exists(self.metadata_path):
-            try:
-                with open(self.metadata_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Error loading metadata: {e}")
-        return {"processed_files": [], "last_updated": None}
-    
-    def _save_metadata(self):
-        """Save metadata about processed files"""
-        try:
-            metadata = {
-                "processed_files": self.processed_files,
-                "last_updated": datetime.now().isoformat()
-            }
-            with open(self.metadata_path, 'w') as f:
-                json.dump(metadata, f)
-            return True
-        except Exception as e:
-            logging.error(f"Error saving metadata: {e}")
-            return False
-        
-    def get_user_documents(self):
-        """Get all text files in the user's formilvus folder"""
-        if not os.path.exists(self.formilvus_folder):
-            os.makedirs(self.formilvus_folder, exist_ok=True)
-            return []
-        
-        files = glob.glob(os.path.join(self.formilvus_folder, "*.txt"))
-        return files
-    
-    def chunk_document(self, text, doc_source):
-        """Split document text into overlapping chunks with improved handling"""
-        chunks = []
-        # Clean text - remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # If text is short enough, return it as a single chunk
-        if len(text) <= CHUNK_SIZE:
-            if len(text) > 20:  # Only include meaningful chunks
-                chunks.append({"text": text, "source": doc_source})
-            return chunks
-            
-        # For longer text, create overlapping chunks
-        for i in range(0, len(text), CHUNK_SIZE - CHUNK_OVERLAP):
-            chunk = text[i:i + CHUNK_SIZE]
-            if len(chunk) > 20:  # Only include meaningful chunks
-                chunks.append({"text": chunk, "source": doc_source})
-        
-        return chunks
-    
-    def update_index_with_new_files(self):
-        """Update the index with only new files, preserving existing data"""
-        files = self.get_user_documents()
-        
-        if not files:
-            logging.info(f"No documents found for user {self.user_email}")
-            return False
-        
-        # Filter for only new files
-        new_files = [f for f in files if os.path.basename(f) not in self.processed_files]
-        
-        if not new_files:
-            logging.info(f"No new documents to process for user {self.user_email}")
-            return True  # Return True because the index exists and is up to date
-        
-        logging.info(f"Processing {len(new_files)} new documents for user {self.user_email}")
-        new_chunks = []
-        
-        # Process each new document
-        for file_path in new_files:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Get filename without extension for reference
-                file_name = os.path.basename(file_path)
-                
-                # Split into chunks
-                doc_chunks = self.chunk_document(content, file_name)
-                new_chunks.extend(doc_chunks)
-                
-                # Mark file as processed
-                self.processed_files.append(file_name)
-                    
-            except UnicodeDecodeError:
-                # Try with different encoding if UTF-8 fails
-                try:
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        content = f.read()
-                    
-                    file_name = os.path.basename(file_path)
-                    doc_chunks = self.chunk_document(content, file_name)
-                    new_chunks.extend(doc_chunks)
-                    
-                    # Mark file as processed
-                    self.processed_files.append(file_name)
-                except Exception as inner_e:
-                    logging.error(f"Error processing document {file_path} with latin-1 encoding: {inner_e}")
-            except Exception as e:
-                logging.error(f"Error processing document {file_path}: {e}")
-        
-        if not new_chunks:
-            logging.info(f"No valid new content chunks found for user {self.user_email}")
-            self._save_metadata()  # Save updated metadata even if no new chunks
-            return True if self.text_chunks else False
-        
-        # Create embeddings for new chunks
-        try:
-            texts = [chunk["text"] for chunk in new_chunks]
-            model = self._get_embedding_model()
-            new_embeddings = model.encode(texts)
-            
-            # Get actual dimensions from the model output
-            actual_dimensions = new_embeddings.shape[1]
-            
-            # Create or extend FAISS index
-            if self.index is None:
-                self.index = faiss.IndexFlatL2(actual_dimensions)
-                self.text_chunks = []
-            
-            # Convert to the right format for FAISS
-            faiss_compatible_embeddings = np.array(new_embeddings).astype('float32')
-            
-            # Check for NaN values
-            if np.isnan(faiss_compatible_embeddings).any():
-                logging.warning(f"Found NaN values in embeddings for user {self.user_email}, replacing with zeros")
-                faiss_compatible_embeddings = np.nan_to_num(faiss_compatible_embeddings)
-            
-            # Add new embeddings to the index
-            self.index.add(faiss_compatible_embeddings)
-            
-            # Add new chunks to our storage
-            self.text_chunks.extend(new_chunks)
-            
-            # Save the updated index, chunks, and metadata
-            self._save_vectors()
-            self._save_metadata()
-            
-            logging.info(f"Updated RAG index for user {self.user_email}, now with {len(self.text_chunks)} total chunks")
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error creating embeddings: {e}")
-            return False
-    
-    def retrieve(self, query, top_k=3):
-        """Retrieve relevant chunks based on query with improved error handling"""
-        if not self.index or not self.text_chunks:
-            if not self.update_index_with_new_files():
-                logging.warning(f"Could not create/retrieve index for user {self.user_email}")
-                return []
-        
-        if len(self.text_chunks) == 0:
-            logging.warning(f"No text chunks available for user {self.user_email}")
-            return []
-            
-        try:
-            # Clean and prepare query
-            query = query.strip()
-            if not query:
-                return []
-                
-            # Get query embedding
-            model = self._get_embedding_model()
-            query_embedding = model.encode([query])
-            
-            # Check that no NaNs were produced
-            if np.isnan(query_embedding).any():
-                logging.warning("Query embedding contains NaN values, replacing with zeros")
-                query_embedding = np.nan_to_num(query_embedding)
-            
-            # Ensure it's the right format for FAISS
-            query_vector = np.array(query_embedding).astype('float32')
-            
-            # Search index
-            max_results = min(top_k, len(self.text_chunks))
-            D, I = self.index.search(query_vector, max_results)
-            
-            # Extract relevant chunks
-            results = []
-            seen_texts = set()  # To avoid duplicates
-            
-            for idx in I[0]:
-                if idx < len(self.text_chunks) and idx >= 0:
-                    chunk = self.text_chunks[idx]
-                    # Avoid exact duplicates
-                    chunk_text = chunk["text"]
-                    if chunk_text not in seen_texts:
-                        results.append(chunk)
-                        seen_texts.add(chunk_text)
-            
-            return results
-            
-        except Exception as e:
-            logging.error(f"Error retrieving from index: {e}")
-            return []
-    
-    def get_context_for_prompt(self, query, max_chunks=3):
-        """Get formatted context from relevant documents for prompt enrichment"""
-        if not query or len(query.strip()) < 5:
-            return ""  # Don't retrieve for very short queries
-            
-        relevant_chunks = self.retrieve(query, top_k=max_chunks)
-        
-        if not relevant_chunks:
-            return ""
-        
-        context = "Here is some relevant information from your documents:\n\n"
-        
-        for i, chunk in enumerate(relevant_chunks):
-            context += f"Document: {chunk['source']}\n"
-            context += f"Content: {chunk['text']}\n\n"
-        
-        return context
-    
-    def delete_file(self, filename):
-        """Delete a file from the index and rebuild the index"""
-        if filename in self.processed_files:
-            # Remove from processed files list
-            self.processed_files.remove(filename)
-            
-            # Delete the actual file if it exists
-            file_path = os.path.join(self.formilvus_folder, filename)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logging.info(f"Deleted file {filename} for user {self.user_email}")
-                except Exception as e:
-                    logging.error(f"Error deleting file {filename}: {e}")
-            
-            # Reset the index and rebuild from remaining files
-            self.index = None
-            self.text_chunks = []
-            
-            # Delete the index files
-            if os.path.exists(self.index_path):
-                os.remove(self.index_path)
-            if os.path.exists(self.chunks_path):
-                os.remove(self.chunks_path)
-            
-            # Save metadata
-            self._save_metadata()
-            
-            # Rebuild index from remaining files
-            self.update_index_with_new_files()
-            return True
-        
-        return False
-    
-    def rebuild_index(self):
-        """Force rebuild the entire index"""
-        try:
-            # Reset the index and metadata
-            self.index = None
-            self.text_chunks = []
-            self.processed_files = []
-            
-            # Delete all vector files
-            if os.path.exists(self.index_path):
-                os.remove(self.index_path)
-            if os.path.exists(self.chunks_path):
-                os.remove(self.chunks_path)
-            
-            # Save metadata
-            self._save_metadata()
-            
-            # Rebuild index from all files
-            success = self.update_index_with_new_files()
-            return success
-        except Exception as e:
-            logging.error(f"Error rebuilding index: {e}")
-            return False
-    
-    def get_document_summary(self):
-        """Get a summary of indexed documents"""
-        metadata = self._load_metadata()
-        return {
-            "total_documents": len(self.processed_files),
-            "total_chunks": len(self.text_chunks),
-            "documents": self.processed_files,
-            "last_updated": metadata.get("last_updated", None)
-        }
-
 def initialize_session():
     """Initialize a new session with separate chat and insight histories."""
     session_id = str(uuid.uuid4())
@@ -525,8 +194,8 @@ def initialize_session():
     4. Provide actionable health guidance"""
     
     # Initialize both chat models with Ollama
-    chat = OllamaChat(model=OLLAMA_MODEL, system_instruction=chat_instruction).start_chat(history=[])
-    insight_chat = OllamaChat(model=OLLAMA_MODEL, system_instruction=insight_instruction).start_chat(history=[])
+    chat = OllamaChat(task="chat", system_instruction=chat_instruction).start_chat(history=[])
+    insight_chat = OllamaChat(task="insights", system_instruction=insight_instruction).start_chat(history=[])
     
     sessions[session_id] = {
         'chat': chat,
@@ -556,17 +225,23 @@ def verify_token(token: str) -> str:
     except:
         return None
 
+def auth_error(authorization):
+    """Check an Authorization header; returns an (error body, status) pair or None"""
+    if not authorization:
+        return {'error': 'No token provided'}, 401
+    
+    token = authorization.split('Bearer ')[-1]
+    email = verify_token(token)
+    if not email:
+        return {'error': 'Invalid token'}, 401
+    return None
+
 def require_auth(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'error': 'No token provided'}), 401
-        
-        token = token.split('Bearer ')[-1]
-        email = verify_token(token)
-        if not email:
-            return jsonify({'error': 'Invalid token'}), 401
+        error = auth_error(request.headers.get('Authorization'))
+        if error:
+            return jsonify(error[0]), error[1]
         
         return f(*args, **kwargs)
     return decorated
@@ -666,6 +341,24 @@ def process_uploaded_file(file_path):
                 return ""
     return ""
 
+def ingest_upload(job, file_path, filename, username, extracted_text_path):
+    """Ingestion job: extract text from an upload, save it for RAG and index it"""
+    job.set_stage("extracting")
+    extracted_text = process_uploaded_file(file_path)
+    if not extracted_text:
+        raise ValueError('Failed to extract text from file or file is empty')
+
+    with open(extracted_text_path, "w", encoding="utf-8") as txtsave:
+        txtsave.write(extracted_text)
+    logging.info(f"Extracted and saved text from {filename} for user {username}")
+    job.set_stage("extracted", text_path=extracted_text_path)
+
+    # Chunk, embed and index now so the user's next "old data" question finds it ready
+    job.set_stage("indexing")
+    if not rag_registry.get(username).index_new_files():
+        raise ValueError(f'No text could be indexed from {filename}')
+    job.set_stage("indexed")
+
 def generate_fallback_insights():
     """Generate fallback insights when the main generation fails."""
     return [
@@ -681,9 +374,9 @@ def generate_fallback_insights():
         }
     ]
 
-def generate_insights(insight_chat, conversation_summary, language):
-    """Generate insights using the dedicated insight chat."""
-    prompt = f"""Analyze this health conversation and return a JSON object with exactly 2 insights.
+def insight_prompt(conversation_summary, language):
+    """Prompt asking the insight chat for a JSON object with two insights"""
+    return f"""Analyze this health conversation and return a JSON object with exactly 2 insights.
 Format the response as below, including ONLY this JSON. Translate your insights to the following language: {language}:
 
 {{
@@ -702,10 +395,11 @@ Format the response as below, including ONLY this JSON. Translate your insights
 }}
 
 Conversation to analyze: {conversation_summary}"""
-    
+
+def parse_insights(response_text):
+    """Extract the insights list from the model's reply, or None if it has none"""
     try:
-        response = insight_chat.send_message(prompt)
-        response_text = response.text.strip()
+        response_text = response_text.strip()
         
         json_start = response_text.find('{')
         json_end = response_text.rfind('}') + 1
@@ -718,12 +412,105 @@ Conversation to analyze: {conversation_summary}"""
                 return insights["insights"]
         
         logging.warning("Could not parse insights response, using fallback")
-        return generate_fallback_insights()
+        return None
         
+    except Exception as e:
+        logging.error(f"Error parsing insights: {str(e)}")
+        return None
+
+def insight_request(insight_chat, prompt, language):
+    """Stateless insight request: the insight system prompt and this prompt only, with its cache key.
+
+    Nothing from earlier insight calls is replayed, so the request size stays
+    constant per turn, and the same conversation window gets the same request
+    in any session.
+    """
+    payload = insight_chat.payload([
+        {"role": "system", "content": insight_chat.system},
+        {"role": "user", "content": prompt}
+    ], language=language)
+    if INSIGHTS_FORMAT == "schema":
+        payload["format"] = INSIGHT_SCHEMA
+    elif INSIGHTS_FORMAT == "json":
+        payload["format"] = "json"
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+    return payload, key
+
+def request_insights(payload):
+    """Stream an insight call and stop it as soon as the JSON object is complete.
+
+    Constrained generation can run on with whitespace after the closing brace
+    until num_predict; closing the stream there makes Ollama stop generating.
+    Returns the parsed insights, or None.
+    """
+    parser = JSONObjectStream()
+    with closing(ollama_client.stream_chat(payload, priority=PRIORITY_INSIGHT)) as stream:
+        for chunk in stream:
+            if parser.feed(chunk.get("message", {}).get("content", "")):
+                break
+    return parse_insights(parser.text)
+
+def generate_insights(insight_chat, conversation_summary, language):
+    """Generate insights using the dedicated insight chat."""
+    prompt = insight_prompt(conversation_summary, language)
+    try:
+        if not INSIGHTS_STATELESS:
+            return (parse_insights(insight_chat.send_message(prompt, priority=PRIORITY_INSIGHT, language=language).text)
+                    or generate_fallback_insights())
+
+        payload, key = insight_request(insight_chat, prompt, language)
+        insights = insight_cache.get(key)
+        if insights is None:
+            insights = request_insights(payload)
+            if insights is None:
+                return generate_fallback_insights()
+            insight_cache.put(key, insights)
+        return insights
     except Exception as e:
         logging.error(f"Error generating insights: {str(e)}")
         return generate_fallback_insights()
 
+def conversation_summary(session_data, prompt=None):
+    """The last two exchanges of a session, as text for the insight prompt.
+
+    With prompt, the summary is taken while the answer is still being generated:
+    it ends with the prompt sent to the model, which carries any retrieved
+    context or document text, in place of the user's last message.
+    """
+    if prompt is None:
+        recent_messages = session_data['chat_history'][-4:]
+    else:
+        recent_messages = session_data['chat_history'][-3:-1] + [{'role': 'user', 'message': prompt}]
+    return "\n".join([
+        f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['message']}"
+        for msg in recent_messages
+    ])
+
+def record_exchange(session_data, chat, prompt, response_text):
+    """Store a completed streamed answer in the model history and the session history"""
+    chat.record(prompt, response_text)
+    session_data['chat_history'].append({'role': 'bot', 'message': response_text})
+
+def start_insights(session_data, prompt, language):
+    """In parallel mode, start generating insights now so they are ready when the answer ends"""
+    if INSIGHTS_MODE == "detached":
+        return None
+    return insight_executor.submit(generate_insights, session_data['insight_chat'],
+                                   conversation_summary(session_data, prompt), language)
+
+def finish_insights(session_data, future, language):
+    """Insight fields of the final frame, once the answer has been recorded.
+
+    In parallel mode this waits for the insights started with the answer. In
+    detached mode it starts them from the full exchange and returns at once;
+    the client fetches them from /insights/<session_id>.
+    """
+    if future is not None:
+        return {"insights": future.result()}
+    session_data['insights'] = insight_executor.submit(generate_insights, session_data['insight_chat'],
+                                                       conversation_summary(session_data), language)
+    return {"insights": None, "insights_pending": True}
+
 def cleanup_sessions():
     """Remove sessions older than 24 hours and cleanup temp files."""
     while True:
@@ -738,6 +525,7 @@ def cleanup_sessions():
                 logging.info(f"Session expired and removed: {sid}")
             
             cleanup_old_audio_files()
+            ingest_queue.prune()
             
         except Exception as e:
             logging.error(f"Error during cleanup: {e}")
@@ -750,36 +538,20 @@ def start_session():
     session_id = initialize_session()
     return jsonify({'session_id': session_id}), 200
 
-# Modified chat route to incorporate RAG
-@app.route('/chat/<session_id>', methods=['POST'])
-@require_auth
-def process_request(session_id):
-    """Handle chat interactions with RAG-enhanced responses and streaming."""
-    if session_id not in sessions:
-        return jsonify({'error': 'Invalid session ID.'}), 400
-
-    session_data = sessions[session_id]
-    chat = session_data['chat']
-    insight_chat = session_data['insight_chat']
-    
-    data = request.get_json()
-    user_message = data.get('user_message', '').strip()
-    language = data.get('language', 'English')
-    user_email = data.get('email', '')  # Get user email from request
-
-    if not user_message:
-        initial_prompt = """Hello! I'm your healthcare assistant. I can help you with general health information and wellness advice. 
+FIRST_MESSAGE = """Hello! I'm your healthcare assistant. I can help you with general health information and wellness advice. 
         Please note that I'm not a replacement for professional medical advice. How can I assist you today?"""
-        session_data['chat_history'] = [{'role': 'bot', 'message': initial_prompt}]
-        return jsonify({
-            'bot_response': initial_prompt,
-            'insights': generate_fallback_insights(),
-            'is_first_message': True
-        }), 200
 
-    # Add to chat history
-    session_data['chat_history'].append({'role': 'user', 'message': user_message})
-    
+def start_conversation(session_data):
+    """Reset the session history and return the greeting response for an empty first message"""
+    session_data['chat_history'] = [{'role': 'bot', 'message': FIRST_MESSAGE}]
+    return {
+        'bot_response': FIRST_MESSAGE,
+        'insights': generate_fallback_insights(),
+        'is_first_message': True
+    }
+
+def build_chat_prompt(user_message, user_email):
+    """Return the message sent to the model, enhanced with the user's documents when they ask for old data"""
     # Check if user message contains "old data" to determine whether to use RAG
     should_use_rag = "old data" in user_message.lower()
     
@@ -788,8 +560,8 @@ def process_request(session_id):
     if user_email and should_use_rag:
         try:
             logging.info(f"User requested old data - using RAG for user {user_email}")
-            rag_manager = RAGManager(user_email)
-            # This automatically loads or updates the vector DB
+            # Reuses the warm per-user manager, refreshing it if new documents landed
+            rag_manager = rag_registry.get(user_email)
             rag_context = rag_manager.get_context_for_prompt(user_message)
             if rag_context:
                 logging.info(f"Found relevant context for query: {user_message[:30]}...")
@@ -800,7 +572,7 @@ def process_request(session_id):
     
     # Enhance prompt with RAG context if available
     if rag_context:
-        enhanced_message = f"""I'm going to answer a user's health-related question. First, here is some relevant context from their documents:
+        return f"""I'm going to answer a user's health-related question. First, here is some relevant context from their documents:
 
 {rag_context}
 
@@ -808,108 +580,28 @@ Now, please respond to the user's question using the context above if relevant:
 {user_message}
 
 Remember to provide a direct answer that incorporates relevant information from their documents if applicable."""
-    else:
-        enhanced_message = user_message
-    
-    # Create streaming response using Ollama's stream feature
-    def generate():
-        # Prepare the messages for Ollama's chat API
-        messages = []
-        
-        # Add system message if available
-        if chat.system:
-            messages.append({"role": "system", "content": chat.system})
-        
-        # Add conversation history
-        for entry in chat.history:
-            if entry["role"] == "user":
-                messages.append({"role": "user", "content": entry["content"]})
-            else:
-                messages.append({"role": "assistant", "content": entry["content"]})
-        
-        # Add current message
-        messages.append({"role": "user", "content": enhanced_message})
-        
-        # Make streaming API call to Ollama
-        response = http_requests.post(
-            f"{OLLAMA_API_URL}/chat",
-            json={
-                "model": chat.model,
-                "messages": messages,
-                "stream": True
-            },
-            stream=True
-        )
-        
-        full_response = ""
-        
-        if response.status_code == 200:
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        chunk = json.loads(line)
-                        if "message" in chunk and "content" in chunk["message"]:
-                            content = chunk["message"]["content"]
-                            full_response += content
-                            yield json.dumps({"chunk": content, "done": False}) + "\n"
-                    except json.JSONDecodeError:
-                        logging.error(f"Failed to parse JSON from stream: {line}")
-            
-            # Update the chat history with the full response
-            chat.history.append({"role": "user", "content": enhanced_message})
-            chat.history.append({"role": "assistant", "content": full_response})
-            
-            # Add to session history
-            session_data['chat_history'].append({'role': 'bot', 'message': full_response})
-            
-            # Generate insights after the full response is collected
-            recent_messages = session_data['chat_history'][-4:]
-            conversation_summary = "\n".join([
-                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['message']}"
-                for msg in recent_messages
-            ])
-            
-            try:
-                insights = generate_insights(insight_chat, conversation_summary, language)
-            except Exception as e:
-                logging.error(f"Failed to generate insights: {str(e)}")
-                insights = generate_fallback_insights()
-            
-            # Send the final message with insights and completion status
-            yield json.dumps({
-                "chunk": "",
-                "done": True,
-                "insights": insights,
-                "is_first_message": False
-            }) + "\n"
-    
-    return app.response_class(generate(), mimetype='application/json')
-
+    return user_message
 
-# Modified file processing route to incorporate RAG
-@app.route('/process_file/<session_id>', methods=['POST'])
-@require_auth
-def process_file(session_id): 
-    """Handle file upload, extract text, and stream LLM-based analysis without RAG."""
+def upload_error(session_id, filename, username):
+    """Validate an upload request; returns an (error body, status) pair or None"""
     if session_id not in sessions:
-        return jsonify({'error': 'Invalid session ID.'}), 400
-
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided.'}), 400
-
-    file = request.files['file']
-    language = request.form.get('language', 'english')
-    username = request.form.get('user')
-
+        return {'error': 'Invalid session ID.'}, 400
+    if filename is None:
+        return {'error': 'No file provided.'}, 400
     if not username:
-        return jsonify({'error': 'User email is required.'}), 400
-
-    if file.filename == '':
-        return jsonify({'error': 'No file selected.'}), 400
-
-    if not allowed_file(file.filename):
-        return jsonify({'error': 'File type not allowed.'}), 400
-
+        return {'error': 'User email is required.'}, 400
+    if filename == '':
+        return {'error': 'No file selected.'}, 400
+    if not allowed_file(filename):
+        return {'error': 'File type not allowed.'}, 400
+    return None
+
+def prepare_file_analysis(filename, content, username):
+    """Queue extraction and indexing of an upload and wait for its text.
+
+    Returns (job_id, analysis prompt, None), or (job_id, None, (body, status))
+    when extraction failed or is still running after INGEST_EXTRACT_TIMEOUT.
+    """
     # Set up folder structure
     PATIENT_DATA_DIR = os.path.join(os.getcwd(), "AAA")
     user_folder = os.path.join(PATIENT_DATA_DIR, username)
@@ -917,35 +609,38 @@ def process_file(session_id):
     os.makedirs(user_folder, exist_ok=True)
     os.makedirs(formilvus_folder, exist_ok=True)
 
-    try:
-        filename = secure_filename(file.filename)
-        unique_filename = f"{int(time.time())}_{filename}"
-        file_path = os.path.join(user_folder, unique_filename)
-        file.save(file_path)
-
-        extracted_text = process_uploaded_file(file_path)
-        if not extracted_text:
-            return jsonify({'error': 'Failed to extract text from file or file is empty'}), 400
-
-        extracted_text_filename = f"{os.path.splitext(filename)[0]}_{int(time.time())}.txt"
-        extracted_text_path = os.path.join(formilvus_folder, extracted_text_filename)
-        with open(extracted_text_path, "w", encoding="utf-8") as txtsave:
-            txtsave.write(extracted_text)
-
-        logging.info(f"Extracted and saved text from {filename} for user {username}")
-
-        session_data = sessions[session_id]
-        chat = session_data['chat']
-        insight_chat = session_data['insight_chat']
-
-        # Save file reference in history
-        session_data['chat_history'].append({
-            'role': 'user',
-            'message': f"I've uploaded a document named {filename}. Can you analyze it for me?"
-        })
-
-        # Prepare summary prompt
-        summary_prompt = f"""I've uploaded a document. Please:
+    filename = secure_filename(filename)
+
+    # The same bytes from the same user map to the same job, so a re-upload is not extracted or indexed twice
+    job_id = hashlib.sha256(f"{username}:".encode('utf-8') + hashlib.sha256(content).digest()).hexdigest()[:32]
+    job = ingest_queue.get(job_id)
+    if job is not None and job.status == "done" and not os.path.exists(job.result["text_path"]):
+        # The extracted text was deleted since; extract it again
+        ingest_queue.discard(job_id)
+        job = None
+    if job is None or job.status == "failed":
+        # Paths follow the job ID, so a retry overwrites its earlier attempt instead of adding a duplicate document
+        file_path = os.path.join(user_folder, f"{job_id[:12]}_{filename}")
+        extracted_text_path = os.path.join(formilvus_folder, f"{os.path.splitext(filename)[0]}_{job_id[:12]}.txt")
+        with open(file_path, 'wb') as f:
+            f.write(content)
+        job = ingest_queue.submit(
+            job_id, username,
+            lambda job: ingest_upload(job, file_path, filename, username, extracted_text_path),
+            description=f"ingest {filename}"
+        )
+
+    # The analysis below needs the text, so wait for extraction only; indexing carries on in the background
+    if not job.wait_for_stage("extracted", timeout=INGEST_EXTRACT_TIMEOUT):
+        if job.status == "failed":
+            return job_id, None, ({'error': job.error, 'job_id': job_id}, 400)
+        return job_id, None, ({'message': 'File is still being processed.', 'job_id': job_id}, 202)
+
+    with open(job.result["text_path"], 'r', encoding='utf-8') as f:
+        extracted_text = f.read()
+
+    # Prepare summary prompt
+    summary_prompt = f"""I've uploaded a document. Please:
 1. Identify what type of medical document this is
 2. Summarize key patient information and findings
 3. Explain any medical terms in simple language
@@ -953,78 +648,195 @@ def process_file(session_id):
 
 Document content:
 {extracted_text[:3000]}{"..." if len(extracted_text) > 3000 else ""}"""
+    return job_id, summary_prompt, None
 
-        def generate():
-            messages = []
-
-            if chat.system:
-                messages.append({"role": "system", "content": chat.system})
+def record_upload(session_data, filename):
+    """Save the file reference in history; called once the analysis is admitted, so a shed request leaves no turn"""
+    session_data['chat_history'].append({
+        'role': 'user',
+        'message': f"I've uploaded a document named {secure_filename(filename)}. Can you analyze it for me?"
+    })
 
-            for entry in chat.history:
-                messages.append({
-                    "role": entry["role"],
-                    "content": entry["content"]
-                })
-
-            messages.append({"role": "user", "content": summary_prompt})
+# Modified chat route to incorporate RAG
+@app.route('/chat/<session_id>', methods=['POST'])
+@require_auth
+def process_request(session_id):
+    """Handle chat interactions with RAG-enhanced responses and streaming."""
+    if session_id not in sessions:
+        return jsonify({'error': 'Invalid session ID.'}), 400
 
-            response = http_requests.post(
-                f"{OLLAMA_API_URL}/chat",
-                json={
-                    "model": chat.model,
-                    "messages": messages,
-                    "stream": True
-                },
-                stream=True
-            )
+    session_data = sessions[session_id]
+    chat = session_data['chat']
+    
+    data = request.get_json()
+    user_message = data.get('user_message', '').strip()
+    language = data.get('language', 'English')
+    user_email = data.get('email', '')  # Get user email from request
 
-            full_response = ""
+    if not user_message:
+        return jsonify(start_conversation(session_data)), 200
 
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk = json.loads(line)
-                            if "message" in chunk and "content" in chunk["message"]:
-                                content = chunk["message"]["content"]
-                                full_response += content
-                                yield json.dumps({"chunk": content, "done": False}) + "\n"
-                        except json.JSONDecodeError:
-                            logging.error(f"Failed to parse JSON from stream: {line}")
-
-                chat.history.append({"role": "user", "content": summary_prompt})
-                chat.history.append({"role": "assistant", "content": full_response})
-                session_data['chat_history'].append({'role': 'bot', 'message': full_response})
-
-                recent_messages = session_data['chat_history'][-4:]
-                conversation_summary = "\n".join([
-                    f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['message']}"
-                    for msg in recent_messages
-                ])
+    enhanced_message = build_chat_prompt(user_message, user_email)
 
-                try:
-                    insights = generate_insights(insight_chat, conversation_summary, language)
-                except Exception as e:
-                    logging.error(f"Failed to generate insights: {str(e)}")
-                    insights = generate_fallback_insights()
+    # Admit the answer before anything is recorded, so a shed request leaves the session untouched
+    try:
+        slot = ollama_client.admit(PRIORITY_INTERACTIVE, affinity=session_id)
+    except LLMOverloaded as e:
+        return jsonify({'error': str(e)}), e.status
 
+    # From here until the response owns the slot, any error must give it back
+    try:
+        # Add to chat history
+        session_data['chat_history'].append({'role': 'user', 'message': user_message})
+        insights = start_insights(session_data, enhanced_message, language)
+    
+        # Create streaming response using Ollama's stream feature
+        def generate():
+            # Make streaming API call to Ollama
+            full_response = ""
+            try:
+                messages = chat.build_messages(enhanced_message)
+                for chunk in ollama_client.stream_chat(chat.payload(messages), slot=slot):
+                    if "message" in chunk and "content" in chunk["message"]:
+                        content = chunk["message"]["content"]
+                        full_response += content
+                        yield json.dumps({"chunk": content, "done": False}) + "\n"
+            except OllamaError as e:
+                logging.error(f"Streaming response failed from model API: {e}")
+                yield json.dumps({'error': 'Streaming failed from model API.'}) + "\n"
+            else:
+                # Update the chat history and the session history with the full response
+                record_exchange(session_data, chat, enhanced_message, full_response)
+            
+                # Send the final message with insights and completion status
                 yield json.dumps({
                     "chunk": "",
                     "done": True,
-                    "insights": insights,
-                    "is_first_message": False,
-                    "file_processed": True
+                    **finish_insights(session_data, insights, language),
+                    "is_first_message": False
                 }) + "\n"
-            else:
-                logging.error("Streaming response failed from model API.")
-                yield json.dumps({'error': 'Streaming failed from model API.'}) + "\n"
+    
+        response = app.response_class(generate(), mimetype='application/json')
+        # Frees the slot even if the client disconnects before the stream starts
+        response.call_on_close(slot.release)
+    except Exception:
+        slot.release()
+        raise
+    return response
+
 
-        return app.response_class(generate(), mimetype='application/json')
+# Modified file processing route to incorporate RAG
+@app.route('/process_file/<session_id>', methods=['POST'])
+@require_auth
+def process_file(session_id): 
+    """Handle file upload, queue background extraction and indexing, and stream LLM-based analysis."""
+    file = request.files.get('file')
+    language = request.form.get('language', 'english')
+    username = request.form.get('user')
+
+    error = upload_error(session_id, file.filename if file else None, username)
+    if error:
+        return jsonify(error[0]), error[1]
+
+    try:
+        job_id, summary_prompt, error = prepare_file_analysis(file.filename, file.read(), username)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        slot = ollama_client.admit(PRIORITY_DOCUMENT, affinity=session_id)
+        # From here until the response owns the slot, any error must give it back
+        try:
+            session_data = sessions[session_id]
+            record_upload(session_data, file.filename)
+            chat = session_data['chat']
+            insights = start_insights(session_data, summary_prompt, language)
 
+            def generate():
+                full_response = ""
+                try:
+                    messages = chat.build_messages(summary_prompt)
+                    for chunk in ollama_client.stream_chat(chat.payload(messages, task="document"), slot=slot):
+                        if "message" in chunk and "content" in chunk["message"]:
+                            content = chunk["message"]["content"]
+                            full_response += content
+                            yield json.dumps({"chunk": content, "done": False}) + "\n"
+                except OllamaError as e:
+                    logging.error(f"Streaming response failed from model API: {e}")
+                    yield json.dumps({'error': 'Streaming failed from model API.'}) + "\n"
+                else:
+                    record_exchange(session_data, chat, summary_prompt, full_response)
+
+                    yield json.dumps({
+                        "chunk": "",
+                        "done": True,
+                        **finish_insights(session_data, insights, language),
+                        "is_first_message": False,
+                        "file_processed": True,
+                        "job_id": job_id
+                    }) + "\n"
+
+            response = app.response_class(generate(), mimetype='application/json')
+            response.call_on_close(slot.release)
+        except Exception:
+            slot.release()
+            raise
+        return response
+
+    except LLMOverloaded as e:
+        logging.error(f"Error processing file: {str(e)}")
+        return jsonify({'error': str(e)}), e.status
+    except IngestQueueFull as e:
+        logging.error(f"Error processing file: {str(e)}")
+        return jsonify({'error': 'Too many files are being processed, please retry shortly.'}), 503
     except Exception as e:
         logging.error(f"Error processing file: {str(e)}")
         return jsonify({'error': f'Failed to process file: {str(e)}'}), 500
-    
+
+@app.route('/insights/<session_id>', methods=['GET'])
+@require_auth
+def get_insights(session_id):
+    """Return the insights of a session's last answer, generated in the background in detached mode"""
+    if session_id not in sessions:
+        return jsonify({'error': 'Invalid session ID.'}), 400
+    future = sessions[session_id].get('insights')
+    if future is None:
+        return jsonify({'error': 'No insights requested for this session.'}), 404
+    try:
+        return jsonify({'insights': future.result(timeout=INSIGHT_WAIT_TIMEOUT)}), 200
+    except FutureTimeoutError:
+        return jsonify({'message': 'Insights are still being generated.'}), 202
+
+@app.route('/ingest_status/<job_id>', methods=['GET'])
+@require_auth
+def ingest_status(job_id):
+    """Report the progress of a background ingestion job"""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job ID.'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/rag_stats', methods=['GET'])
+@require_auth
+def rag_stats():
+    """Report retrieval and insight cache, manager registry and ingestion queue counters"""
+    return jsonify({
+        'query_embedding_cache': query_embedding_cache.stats(),
+        'retrieval_cache': retrieval_cache.stats(),
+        'insight_cache': insight_cache.stats(),
+        'registry': rag_registry.stats(),
+        'ingest_queue': ingest_queue.stats(),
+    }), 200
+    
+
+@app.route('/llm_stats', methods=['GET'])
+@require_auth
+def llm_stats():
+    """Report per-backend health, circuit state, scheduler queue depth and wait times, and per-model
+    latency (time to first token, loads, prompt evaluation)"""
+    return jsonify({
+        'ollama': ollama_client.stats(),
+        'models': model_stats.stats(),
+    }), 200
 
 # New route to explicitly refresh the RAG index for a user
 @app.route('/refresh_rag_index', methods=['POST'])
@@ -1038,8 +850,8 @@ def refresh_rag_index():
         return jsonify({'error': 'User email is required'}), 400
     
     try:
-        rag_manager = RAGManager(user_email)
-        success = rag_manager.create_index()
+        rag_manager = rag_registry.get(user_email)
+        success = rag_manager.rebuild_index()
         
         if success:
             return jsonify({'message': 'RAG index refreshed successfully'}), 200
@@ -1096,5 +908,23 @@ atexit.register(cleanup_on_shutdown)
 cleanup_thread = Thread(target=cleanup_sessions, daemon=True)
 cleanup_thread.start()
 
+# Optionally load the shared embedding model now instead of on the first RAG query
+if os.getenv("EMBEDDING_WARMUP", "false").lower() == "true":
+    Thread(target=embedding_service.warmup, daemon=True).start()
+
+def preload_ollama_models():
+    """Load the configured Ollama models now so the first chat doesn't wait for a model load"""
+    # Learn which models are pulled first, so tasks whose model is missing preload their fallback
+    ollama_client.check_health()
+    for model in preload_models():
+        try:
+            ollama_client.load(model)
+            logging.info(f"Preloaded Ollama model {model}")
+        except (OllamaError, LLMOverloaded) as e:
+            logging.error(f"Could not preload Ollama model {model}: {e}")
+
+Thread(target=preload_ollama_models, daemon=True).start()
+ollama_client.start_health_checks()
+
 if __name__ == '__main__':
     app.run(debug=True, port=4000)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Repeated chat questions skip the encoder forward pass and the vector search
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+
+
+def normalize_query(query):
+    """Collapse whitespace and case; all-MiniLM-L6-v2 is uncased, so the embedding is unchanged"""
+    return re.sub(r'\s+', ' ', query).strip().lower()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU mapping with hit/miss counters"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide caches shared by every RAGManager
+# normalized query -> float32 embedding of shape (1, dim)
+query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+# (user_email, index_version, normalized query, top_k) -> ranked chunk IDs
+retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
@@ -0,0 +1,691 @@
+import os
+import json
+import hashlib
+import logging
+import weakref
+import threading
+from collections import OrderedDict
+from functools import wraps
+from datetime import datetime
+
+import numpy as np
+import faiss
+
+from embedding_service import embedding_service, EMBEDDING_BATCH_MAX
+from chunker import chunk_file, chunk_stream
+from embedding_cache import EmbeddingCache
+from query_cache import normalize_query, query_embedding_cache, retrieval_cache
+from chunk_store import ChunkStore
+from ingest_queue import ingest_queue
+from segment_store import SegmentStore
+from vector_index import build_index, choose_index_kind, read_index
+
+# Base directory for user data
+BASE_DATA_DIR = os.path.join(os.getcwd(), "AAA")
+
+# RAG configuration
+INDEX_DIMENSIONS = 384  # Dimensions of the embeddings from all-MiniLM-L6-v2
+
+# Registry of live per-user managers
+RAG_REGISTRY_MAX_USERS = int(os.getenv("RAG_REGISTRY_MAX_USERS", "32"))
+RAG_REGISTRY_MAX_MB = int(os.getenv("RAG_REGISTRY_MAX_MB", "512"))
+
+# Open saved indexes memory-mapped read-only so worker processes share one physical copy
+RAG_INDEX_MMAP = os.getenv("RAG_INDEX_MMAP", "true").lower() == "true"
+
+# Hybrid retrieval: fuse vector and BM25 keyword rankings with reciprocal-rank fusion
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").lower() == "true"
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))  # candidates taken from each ranking
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Compressed indexes (RAG_INDEX_STORAGE) fetch this many times more candidates and re-rank them
+# exactly against the cached vectors; 0 or 1 disables the re-rank
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+
+def file_record(file_path):
+    """Size, mtime and content hash of a file for the file manifest, or None if it cannot be read"""
+    try:
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha1.update(block)
+            st = os.fstat(f.fileno())
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": sha1.hexdigest()}
+    except Exception as e:
+        logging.error(f"Error processing document {file_path}: {e}")
+        return None
+
+def synchronized(method):
+    """Serialize calls to a RAGManager method on the manager's lock"""
+    @wraps(method)
+    def decorated(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return decorated
+
+def serialized_update(method):
+    """Allow one index update per manager at a time without blocking readers"""
+    @wraps(method)
+    def decorated(self, *args, **kwargs):
+        with self.update_lock:
+            return method(self, *args, **kwargs)
+    return decorated
+
+# Improved RAG Manager class with persistence
+class RAGManager:
+    """Manages retrieval-augmented generation for user-specific data with persistence"""
+    def __init__(self, user_email):
+        self.user_email = user_email
+        self.user_folder = os.path.join(BASE_DATA_DIR, user_email)
+        self.formilvus_folder = os.path.join(self.user_folder, "formilvus")
+        self.vectors_folder = os.path.join(self.user_folder, "vectors")
+        
+        # Managers are shared between request threads through the registry. `lock` guards
+        # the index and chunk store; `update_lock` serializes the slow read/chunk/embed
+        # phase of updates so retrieve() only waits for the final in-memory swap.
+        self.lock = threading.RLock()
+        self.update_lock = threading.RLock()
+        
+        # Create necessary directories
+        os.makedirs(self.formilvus_folder, exist_ok=True)
+        os.makedirs(self.vectors_folder, exist_ok=True)
+        
+        # Path for saving index and metadata (faiss_index.bin is the pre-segment layout)
+        self.index_path = os.path.join(self.vectors_folder, "faiss_index.bin")
+        self.chunks_path = os.path.join(self.vectors_folder, "text_chunks.pkl")
+        self.metadata_path = os.path.join(self.vectors_folder, "metadata.json")
+        
+        # Chunk vectors keyed by content hash, reused across rebuilds, deletes and re-uploads
+        self.embedding_cache = EmbeddingCache(os.path.join(self.vectors_folder, "embedding_cache"))
+        
+        # Chunk text and sources live in a memory-mapped store; vectors and keyword postings
+        # live in immutable segments under stable chunk IDs, so uploads only write the new
+        # data and a document can be removed without touching the others. Segment indexes
+        # are only read on first search, memory-mapped when RAG_INDEX_MMAP is enabled.
+        self.chunk_store = ChunkStore(os.path.join(self.vectors_folder, "chunks"))
+        self.segments = SegmentStore(os.path.join(self.vectors_folder, "segments"), mmap=RAG_INDEX_MMAP)
+        self._compaction_checked = False
+        self._load_vectors()
+        
+        # Manifest of indexed files: name -> {"size", "mtime_ns", "sha1", "chunk_ids": [start, end)}
+        metadata = self._load_metadata()
+        # Bumped on every index change; part of the retrieval cache key
+        self.index_version = metadata.get("index_version", 0)
+        self.files = metadata.get("files")
+        if self.files is None:
+            self.files = self._migrate_processed_files(metadata.get("processed_files", []))
+            self._save_metadata()
+    
+    def _load_vectors(self):
+        """Migrate legacy pickled chunks and single-file indexes, and drop chunks a crash left unpublished"""
+        try:
+            if os.path.exists(self.chunks_path):
+                self._migrate_pickled_chunks()
+            if os.path.exists(self.index_path):
+                logging.info(f"Migrating faiss_index.bin for user {self.user_email} to a segment")
+                chunk_ids = self.chunk_store.live_ids()
+                self.segments.adopt(self.index_path, chunk_ids, self.chunk_store.texts(chunk_ids))
+                legacy_keywords = os.path.join(self.vectors_folder, "bm25_index.npz")
+                if os.path.exists(legacy_keywords):
+                    os.remove(legacy_keywords)
+            # Chunks appended after the last published segment never got their vectors
+            orphans = [chunk_id for chunk_id in self.chunk_store.live_ids() if chunk_id >= self.segments.next_id]
+            if orphans:
+                logging.warning(f"Dropping {len(orphans)} unpublished chunks for user {self.user_email}")
+                self.chunk_store.remove(orphans)
+            return True
+        except Exception as e:
+            logging.error(f"Error migrating vector database: {e}")
+            return False
+    
+    def _migrate_pickled_chunks(self):
+        """Move a legacy text_chunks.pkl into the chunk store, re-keying positional indexes by chunk ID"""
+        logging.info(f"Migrating pickled text chunks for user {self.user_email} to the chunk store")
+        positional = self.chunk_store.import_pickle(self.chunks_path)
+        if positional and os.path.exists(self.index_path):
+            index = read_index(self.index_path)
+            vectors = index.reconstruct_n(0, index.ntotal)
+            index = build_index(choose_index_kind(index.ntotal), vectors, np.arange(index.ntotal))
+            tmp_path = self.index_path + ".tmp"
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+        os.remove(self.chunks_path)
+    
+    def _migrate_processed_files(self, processed_files):
+        """Build manifest entries for files indexed before the manifest existed"""
+        files = {}
+        for file_name in processed_files:
+            record = file_record(os.path.join(self.formilvus_folder, file_name))
+            # A file that is gone keeps a placeholder so the next update retires its chunks
+            record = record or {"size": -1, "mtime_ns": -1, "sha1": None}
+            chunk_ids = self.chunk_store.ids_for_source(file_name)
+            if chunk_ids:
+                record["chunk_ids"] = [min(chunk_ids), max(chunk_ids) + 1]
+            else:
+                record["chunk_ids"] = [self.chunk_store.next_id, self.chunk_store.next_id]
+            files[file_name] = record
+        if files:
+            logging.info(f"Built file manifest for {len(files)} documents of user {self.user_email}")
+        return files
+    
+    def _load_metadata(self):
+        """Load metadata about processed files"""
+        if os.path.exists(self.metadata_path):
+            try:
+                with open(self.metadata_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.error(f"Error loading metadata: {e}")
+        return {"files": {}, "last_updated": None}
+    
+    def _save_metadata(self):
+        """Save metadata about processed files and retire cached retrievals for the old index version"""
+        try:
+            self.index_version += 1
+            user_email = self.user_email
+            retrieval_cache.discard_where(lambda key: key[0] == user_email)
+            metadata = {
+                "files": self.files,
+                "index_version": self.index_version,
+                "last_updated": datetime.now().isoformat()
+            }
+            # Write then rename so a crash never leaves half a metadata file
+            tmp_path = self.metadata_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, self.metadata_path)
+            return True
+        except Exception as e:
+            logging.error(f"Error saving metadata: {e}")
+            return False
+        
+    def stale_documents(self):
+        """Compare the folder with the manifest using stat calls only.
+        
+        Returns (paths of new or possibly modified files, names of files that disappeared).
+        """
+        stale = []
+        present = set()
+        with os.scandir(self.formilvus_folder) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".txt") or not entry.is_file():
+                    continue
+                present.add(entry.name)
+                record = self.files.get(entry.name)
+                st = entry.stat()
+                if record is None or record["size"] != st.st_size or record["mtime_ns"] != st.st_mtime_ns:
+                    stale.append(entry.path)
+        removed = [file_name for file_name in self.files if file_name not in present]
+        return stale, removed
+    
+    @staticmethod
+    def chunk_document(text, doc_source):
+        """Split document text into sentence-aligned, overlapping chunks (see chunker.chunk_stream)"""
+        return list(chunk_stream([text], doc_source))
+    
+    @serialized_update
+    def index_new_files(self):
+        """Index new and modified files and drop removed ones, preserving everything unchanged.
+        
+        Returns whether the index holds any chunks; raises if reading, embedding or
+        publishing fails, so background jobs are marked failed and can be resubmitted.
+        """
+        stale_files, removed = self.stale_documents()
+        
+        if not stale_files and not removed:
+            if not self.files:
+                logging.info(f"No documents found for user {self.user_email}")
+                return False
+            logging.info(f"No new documents to process for user {self.user_email}")
+            return True  # Return True because the index exists and is up to date
+        
+        logging.info(f"Processing {len(stale_files)} new or changed and {len(removed)} removed documents "
+                     f"for user {self.user_email}")
+        new_chunks = []
+        embedding_batches = []
+        batch = []
+        files = {}
+        
+        def embed_batch():
+            embedding_batches.append(self.embedding_cache.embed([chunk["text"] for chunk in batch]))
+            new_chunks.extend(batch)
+            batch.clear()
+        
+        # Process each new or changed document
+        for file_path in stale_files:
+            record = file_record(file_path)
+            if record is None:
+                continue
+            
+            # Get filename without extension for reference
+            file_name = os.path.basename(file_path)
+            
+            current = self.files.get(file_name)
+            if current is not None and current["sha1"] == record["sha1"]:
+                # Touched but not modified - only the stat fields change
+                files[file_name] = {**record, "chunk_ids": current["chunk_ids"]}
+                continue
+            
+            # Stream the file into chunks, embedding them batch by batch as they are produced
+            for chunk in chunk_file(file_path, file_name):
+                batch.append(chunk)
+                if len(batch) >= EMBEDDING_BATCH_MAX:
+                    embed_batch()
+            files[file_name] = record
+        if batch:
+            embed_batch()
+        
+        new_embeddings = np.concatenate(embedding_batches) if embedding_batches else None
+        self.add_embedded_chunks(files, new_chunks, new_embeddings, removed=removed)
+        return True if len(self.chunk_store) else False
+    
+    def update_index_with_new_files(self):
+        """index_new_files(), reporting a failure as False"""
+        try:
+            return self.index_new_files()
+        except Exception as e:
+            logging.error(f"Error creating embeddings: {e}")
+            return False
+    
+    @serialized_update
+    def add_embedded_chunks(self, files, new_chunks, new_embeddings, removed=()):
+        """Add already-embedded chunks to the index and record their files in the manifest.
+        
+        files maps file names to manifest records; new_chunks must be grouped by file in the
+        same order. Chunks of an earlier version of those files, and of the removed file
+        names, are retired once the new segment is published.
+        """
+        # Assign each (re)indexed file the contiguous range of chunk IDs its chunks get
+        counts = {}
+        for chunk in new_chunks:
+            counts[chunk["source"]] = counts.get(chunk["source"], 0) + 1
+        
+        with self.lock:
+            if not len(self.segments):
+                self.chunk_store.clear()
+            next_id = self.chunk_store.next_id
+            position = next_id
+            for file_name, record in files.items():
+                if "chunk_ids" not in record:
+                    record["chunk_ids"] = [position, position + counts.get(file_name, 0)]
+                    position += counts.get(file_name, 0)
+            chunk_ids = np.arange(next_id, next_id + len(new_chunks), dtype='int64')
+            # Append only the new chunks to the chunk store, under fresh chunk IDs
+            if new_chunks:
+                self.chunk_store.append(chunk_ids.tolist(), new_chunks)
+        
+        segment = None
+        if new_chunks:
+            # Convert to the right format for FAISS
+            faiss_compatible_embeddings = np.array(new_embeddings).astype('float32')
+            
+            # Check for NaN values
+            if np.isnan(faiss_compatible_embeddings).any():
+                logging.warning(f"Found NaN values in embeddings for user {self.user_email}, replacing with zeros")
+                faiss_compatible_embeddings = np.nan_to_num(faiss_compatible_embeddings)
+            
+            # Write the chunks as a new segment; readers keep searching the published ones meanwhile
+            segment = self.segments.write(faiss_compatible_embeddings, chunk_ids,
+                                          [chunk["text"] for chunk in new_chunks])
+        
+        with self.lock:
+            if segment is not None:
+                self.segments.publish(added=[segment])
+            # Retire the chunks of replaced and removed files now that their successors are searchable
+            for file_name in list(files) + list(removed):
+                old = self.files.get(file_name)
+                new = files.get(file_name)
+                if old is not None and (new is None or new["chunk_ids"] != old["chunk_ids"]):
+                    self.chunk_store.remove(list(range(*old["chunk_ids"])))
+            for file_name in removed:
+                self.files.pop(file_name, None)
+            self.files.update(files)
+            if not len(self.chunk_store) and len(self.segments):
+                self.segments.clear()
+                self.chunk_store.clear()
+            self._save_metadata()
+        
+        logging.info(f"Updated RAG index for user {self.user_email}, now with {len(self.chunk_store)} total chunks "
+                     f"in {len(self.segments)} segments")
+        if len(self.segments):
+            self._schedule_compaction()
+        return True
+    
+    def _schedule_compaction(self):
+        """Queue a background compaction if segments need merging or hold many deleted chunks"""
+        self._compaction_checked = True
+        if not self.segments.compaction_plan(self.chunk_store.live_mask):
+            return None
+        return ingest_queue.submit(f"compact:{self.user_email}:{self.segments.generation}", self.user_email,
+                                   lambda job: self.compact_segments(), description="compact index segments")
+    
+    @serialized_update
+    def compact_segments(self):
+        """Merge small segments and drop deleted chunks, rebuilding from cached vectors"""
+        plan = self.segments.compaction_plan(self.chunk_store.live_mask)
+        if not plan:
+            return False
+        ids = np.concatenate([np.asarray(segment.ids)[self.chunk_store.live_mask(segment.ids)] for segment in plan])
+        texts = self.chunk_store.texts(ids.tolist())
+        vectors = self.embedding_cache.embed(texts)
+        
+        merged = [self.segments.write(vectors, ids, texts)] if len(ids) else []
+        with self.lock:
+            self.segments.publish(added=merged, removed=plan)
+            self._save_metadata()
+        logging.info(f"Compacted {len(plan)} segments into one with {len(ids)} chunks for user {self.user_email}: "
+                     f"{self.segments.describe()}")
+        return True
+    
+    @synchronized
+    def retrieve(self, query, top_k=3):
+        """Retrieve relevant chunks based on query with improved error handling"""
+        if not len(self.segments) or not len(self.chunk_store):
+            # Never index on the chat path - queue it and answer without document context for now
+            rag_registry.refresh_async(self.user_email)
+            logging.info(f"No index yet for user {self.user_email}, indexing queued in the background")
+            return []
+        
+        try:
+            # Clean and prepare query
+            query = normalize_query(query)
+            if not query:
+                return []
+            
+            # Repeated questions reuse the ranked chunk IDs until the index changes
+            cache_key = (self.user_email, self.index_version, query, top_k)
+            result_ids = retrieval_cache.get(cache_key)
+            if result_ids is None:
+                result_ids = self._search(query, top_k)
+                retrieval_cache.put(cache_key, result_ids)
+                if not self._compaction_checked:
+                    # Segments written under older settings get converted in the background
+                    self._schedule_compaction()
+            
+            results = []
+            for chunk_id in result_ids:
+                chunk = self.chunk_store.get(chunk_id)
+                if chunk is not None:
+                    results.append(chunk)
+            return results
+            
+        except Exception as e:
+            logging.error(f"Error retrieving from index: {e}")
+            return []
+    
+    def _embed_query(self, query):
+        """Embed a normalized query, reusing the embedding of an identical earlier query"""
+        query_embedding = query_embedding_cache.get(query)
+        if query_embedding is not None:
+            return query_embedding
+        
+        # Get query embedding
+        query_embedding = embedding_service.encode([query])
+        
+        # Check that no NaNs were produced
+        if np.isnan(query_embedding).any():
+            logging.warning("Query embedding contains NaN values, replacing with zeros")
+            query_embedding = np.nan_to_num(query_embedding)
+        
+        # Ensure it's the right format for FAISS
+        query_embedding = np.array(query_embedding).astype('float32')
+        query_embedding_cache.put(query, query_embedding)
+        return query_embedding
+    
+    def _search(self, query, top_k):
+        """Return the IDs of the top_k distinct chunks for a normalized query"""
+        query_vector = self._embed_query(query)
+        
+        # Search all segments, over-fetching by the number of vectors that belong to deleted chunks
+        candidates = max(top_k, RAG_HYBRID_CANDIDATES) if RAG_HYBRID else top_k
+        rerank = RAG_RERANK_FACTOR > 1 and self.segments.compressed()
+        fetch = candidates * RAG_RERANK_FACTOR if rerank else candidates
+        dead_vectors = self.segments.ntotal - len(self.chunk_store)
+        ranked_ids = [chunk_id for chunk_id in self.segments.search(query_vector, fetch + dead_vectors)
+                      if chunk_id in self.chunk_store][:fetch]
+        if rerank:
+            ranked_ids = self._rerank_exact(query_vector, ranked_ids)
+        ranked_ids = ranked_ids[:candidates]
+        
+        if RAG_HYBRID:
+            keyword_ids = [chunk_id for chunk_id, _ in self.segments.keyword_search(query, candidates + dead_vectors)
+                           if chunk_id in self.chunk_store][:candidates]
+            ranked_ids = self._fuse_rankings(ranked_ids, keyword_ids)
+        
+        # Extract relevant chunks
+        result_ids = []
+        seen_texts = set()  # To avoid duplicates
+        
+        for chunk_id in ranked_ids:
+            chunk = self.chunk_store.get(chunk_id)
+            if chunk is not None:
+                # Avoid exact duplicates
+                chunk_text = chunk["text"]
+                if chunk_text not in seen_texts:
+                    result_ids.append(chunk_id)
+                    seen_texts.add(chunk_text)
+            if len(result_ids) >= top_k:
+                break
+        
+        return result_ids
+    
+    def _rerank_exact(self, query_vector, chunk_ids):
+        """Order candidates from a compressed index by their distance to the cached embeddings"""
+        vectors, missing = self.embedding_cache.get(self.chunk_store.texts(chunk_ids))
+        if vectors is None or missing:
+            return chunk_ids  # cache was compacted past these chunks; keep the approximate order
+        distances = ((vectors - query_vector) ** 2).sum(axis=1)
+        return [chunk_ids[i] for i in np.argsort(distances, kind='stable')]
+    
+    @staticmethod
+    def _fuse_rankings(*rankings):
+        """Reciprocal-rank fusion: order chunk IDs by the sum of 1 / (RAG_RRF_K + rank) over rankings"""
+        scores = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking, start=1):
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (RAG_RRF_K + rank)
+        return sorted(scores, key=scores.get, reverse=True)
+    
+    def get_context_for_prompt(self, query, max_chunks=3):
+        """Get formatted context from relevant documents for prompt enrichment"""
+        if not query or len(query.strip()) < 5:
+            return ""  # Don't retrieve for very short queries
+            
+        relevant_chunks = self.retrieve(query, top_k=max_chunks)
+        
+        if not relevant_chunks:
+            return ""
+        
+        context = "Here is some relevant information from your documents:\n\n"
+        
+        for i, chunk in enumerate(relevant_chunks):
+            context += f"Document: {chunk['source']}\n"
+            context += f"Content: {chunk['text']}\n\n"
+        
+        return context
+    
+    @serialized_update
+    @synchronized
+    def delete_file(self, filename):
+        """Delete a file and remove only its chunks from the index"""
+        if filename in self.files:
+            # Remove from the file manifest
+            record = self.files.pop(filename)
+            
+            # Delete the actual file if it exists
+            file_path = os.path.join(self.formilvus_folder, filename)
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                    logging.info(f"Deleted file {filename} for user {self.user_email}")
+                except Exception as e:
+                    logging.error(f"Error deleting file {filename}: {e}")
+            
+            # Mark the document's chunks deleted; their vectors stay in the segments until compaction
+            chunk_ids = list(range(*record["chunk_ids"]))
+            if chunk_ids:
+                self.chunk_store.remove(chunk_ids)
+                logging.info(f"Removed {len(chunk_ids)} chunks of {filename} for user {self.user_email}")
+            
+            if not len(self.chunk_store):
+                # Nothing left to search - drop the segments and chunk files entirely
+                self.segments.clear()
+                self.chunk_store.clear()
+            
+            # Save metadata
+            self._save_metadata()
+            if len(self.segments):
+                self._schedule_compaction()
+            return True
+        
+        return False
+    
+    @serialized_update
+    @synchronized
+    def rebuild_index(self):
+        """Force rebuild the entire index"""
+        try:
+            # Reset the index and metadata, deleting all segment files
+            self.segments.clear()
+            self.chunk_store.clear()
+            self.files = {}
+            
+            # Save metadata
+            self._save_metadata()
+            
+            # Rebuild index from all files; cached vectors make this cheap
+            success = self.update_index_with_new_files()
+            
+            # Drop vectors for chunks that no longer exist once they dominate the cache
+            if len(self.embedding_cache) > 2 * max(len(self.chunk_store), 1):
+                self.embedding_cache.compact(self.chunk_store.texts(self.chunk_store.live_ids()))
+            return success
+        except Exception as e:
+            logging.error(f"Error rebuilding index: {e}")
+            return False
+    
+    def estimated_size(self):
+        """Rough number of bytes the manager keeps in memory or mapped: segment indexes and chunk text"""
+        return self.segments.nbytes() + self.chunk_store.nbytes()
+    
+    def get_document_summary(self):
+        """Get a summary of indexed documents"""
+        metadata = self._load_metadata()
+        return {
+            "total_documents": len(self.files),
+            "total_chunks": len(self.chunk_store),
+            "documents": list(self.files),
+            "last_updated": metadata.get("last_updated", None)
+        }
+
+
+class RAGRegistry:
+    """Thread-safe LRU registry of live RAGManager instances, one per user"""
+    def __init__(self, max_users=RAG_REGISTRY_MAX_USERS, max_bytes=RAG_REGISTRY_MAX_MB * 1024 * 1024):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # user_email -> {"manager", "signature", "size"}, least recently used first
+        self._entries = OrderedDict()
+        # Every manager still referenced anywhere, evicted or not. Eviction only drops the LRU's
+        # reference; a manager a job or request still holds is reused rather than rebuilt, so two
+        # managers never write the same user's store
+        self._managers = weakref.WeakValueDictionary()
+        # Per-user locks so a manager is never built twice for the same user
+        self._user_locks = {}
+    
+    def _user_lock(self, user_email):
+        with self._lock:
+            if user_email not in self._user_locks:
+                self._user_locks[user_email] = threading.Lock()
+            return self._user_locks[user_email]
+    
+    def _folder_signature(self, user_email):
+        """Cheap stat-based fingerprint of the user's documents: name, size and mtime of every .txt file.
+        
+        Files are stat'ed individually because editing one in place leaves the folder's mtime unchanged.
+        """
+        folder = os.path.join(BASE_DATA_DIR, user_email, "formilvus")
+        try:
+            with os.scandir(folder) as entries:
+                stats = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries
+                               if entry.name.endswith(".txt") and entry.is_file())
+        except OSError:
+            return None
+        return hashlib.sha1(repr(stats).encode('utf-8')).hexdigest()[:16]
+    
+    def get(self, user_email):
+        """Return the warm manager for a user, building or refreshing it as needed"""
+        with self._user_lock(user_email):
+            signature = self._folder_signature(user_email)
+            with self._lock:
+                entry = self._entries.get(user_email)
+                if entry is not None:
+                    self._entries.move_to_end(user_email)
+            
+            if entry is None:
+                manager = self._managers.get(user_email)
+                if manager is None:
+                    manager = RAGManager(user_email)
+                    self._managers[user_email] = manager
+                    logging.info(f"RAG registry: loaded manager for user {user_email}")
+                else:
+                    logging.info(f"RAG registry: reusing evicted manager still in use for user {user_email}")
+                # The folder is created by the manager, so take the signature afterwards
+                entry = {"manager": manager, "signature": self._folder_signature(user_email), "size": 0}
+                # Pick up documents that landed while no manager was live
+                self.refresh_async(user_email)
+            elif entry["signature"] != signature:
+                # New or removed documents - index them in the background, keep serving the warm manager
+                logging.info(f"RAG registry: documents changed for user {user_email}, refreshing index")
+                entry["signature"] = signature
+                self.refresh_async(user_email)
+            
+            # Re-measured on every get: indexes load lazily and grow with each update
+            size = entry["manager"].estimated_size()
+            with self._lock:
+                entry["size"] = size
+                self._entries[user_email] = entry
+                self._entries.move_to_end(user_email)
+                self._evict()
+            return entry["manager"]
+    
+    def refresh_async(self, user_email):
+        """Queue indexing of any new documents for a user; idempotent per folder state"""
+        signature = self._folder_signature(user_email)
+        job_id = f"index:{user_email}:{signature or 0}"
+        return ingest_queue.submit(job_id, user_email, lambda job: self._refresh(user_email),
+                                   description="index new documents")
+    
+    def _refresh(self, user_email):
+        """Index job: update the user's index, then account for its new size if the manager is still live"""
+        manager = self.get(user_email)
+        manager.index_new_files()
+        size = manager.estimated_size()
+        with self._lock:
+            entry = self._entries.get(user_email)
+            if entry is not None and entry["manager"] is manager:
+                entry["size"] = size
+                self._evict()
+    
+    def _evict(self):
+        """Evict least recently used managers beyond the user count or memory budget"""
+        total = sum(entry["size"] for entry in self._entries.values())
+        while len(self._entries) > 1 and (len(self._entries) > self.max_users or total > self.max_bytes):
+            user_email, entry = self._entries.popitem(last=False)
+            total -= entry["size"]
+            logging.info(f"RAG registry: evicted manager for user {user_email}")
+    
+    def stats(self):
+        """Summary of the registry contents"""
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "max_users": self.max_users,
+                "estimated_bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Global registry shared by all request threads
+rag_registry = RAGRegistry()
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import logging
+
+import numpy as np
+import faiss
+
+from bm25_index import BM25Index, search_indexes
+from vector_index import build_index, choose_index_kind, describe, index_storage, needs_rebuild, read_index
+
+# Merge the smallest segments once a user has more than this many
+RAG_MAX_SEGMENTS = int(os.getenv("RAG_MAX_SEGMENTS", "8"))
+# Unpublished segment files younger than this may still be in the middle of being written by
+# another process (a bulk ingest or another worker), so startup cleanup leaves them alone
+RAG_ORPHAN_GRACE_SECONDS = float(os.getenv("RAG_ORPHAN_GRACE_SECONDS", "3600"))
+
+
+class Segment:
+    """One immutable slice of a user's corpus: a FAISS index, a BM25 index and the chunk IDs they hold"""
+    def __init__(self, folder, name, count, mmap=False):
+        self.name = name
+        self.count = count
+        self.mmap = mmap
+        self.index_path = os.path.join(folder, f"{name}.faiss")
+        self.keywords_path = os.path.join(folder, f"{name}.bm25.npz")
+        self.ids_path = os.path.join(folder, f"{name}.ids.npy")
+        self._index = None
+        self._storage = None
+        self._keywords = None
+        self._ids = None
+        self._nbytes = None
+
+    @property
+    def paths(self):
+        return (self.index_path, self.keywords_path, self.ids_path)
+
+    @property
+    def index(self):
+        """FAISS index, read on first use and memory-mapped when mmap is set"""
+        if self._index is None:
+            self._index = read_index(self.index_path, mmap=self.mmap)
+            self._storage = index_storage(self._index)
+        return self._index
+
+    @property
+    def storage(self):
+        """Storage mode of the index (see vector_index.STORAGE_MODES)"""
+        return self._storage if self._index is not None else index_storage(self.index)
+
+    @property
+    def keywords(self):
+        if self._keywords is None:
+            self._keywords = BM25Index(self.keywords_path)
+        return self._keywords
+
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = np.load(self.ids_path, mmap_mode='r')
+        return self._ids
+
+    def close(self):
+        """Drop the loaded index, keywords and IDs, releasing the memory-mapped files"""
+        self._index = None
+        self._keywords = None
+        self._ids = None
+
+    def nbytes(self):
+        """Size of the segment's files: what searching it reads into memory or maps (segments are immutable)"""
+        if self._nbytes is None:
+            self._nbytes = sum(os.path.getsize(path) for path in self.paths if os.path.exists(path))
+        return self._nbytes
+
+    @classmethod
+    def write(cls, folder, name, vectors, ids, texts, mmap=False):
+        """Build and write a new segment; its files are complete before any manifest references them"""
+        ids = np.asarray(ids, dtype='int64')
+        index = build_index(choose_index_kind(len(ids)), vectors, ids)
+        segment = cls(folder, name, len(ids), mmap)
+
+        tmp_path = segment.index_path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, segment.index_path)
+
+        keywords = BM25Index(segment.keywords_path)
+        keywords.add(ids, texts)
+        keywords.save()
+
+        tmp_path = segment.ids_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, ids)
+        os.replace(tmp_path, segment.ids_path)
+        return segment
+
+
+class SegmentStore:
+    """A user's vectors as a set of immutable segments listed in segments.json.
+
+    Each upload writes one small new segment, so write cost is proportional
+    to the new data. Searches fan out over all segments and merge the top-k.
+    Deleted chunks are only marked in the chunk store; compact() later merges
+    small segments and drops deleted chunks into a fresh segment. Rewriting
+    segments.json via temp file + rename is the single atomic step that
+    publishes every change, so a crash leaves either the old or the new set.
+    """
+    def __init__(self, folder, mmap=False):
+        self.folder = folder
+        self.mmap = mmap
+        self.manifest_path = os.path.join(folder, "segments.json")
+        self._retired = []  # files of removed segments that could not be deleted yet
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        self.segments = []
+        self.generation = 0
+        self.next_segment = 0
+        self.next_id = 0  # chunk IDs below this are covered by published segments
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            self.generation = manifest["generation"]
+            self.next_segment = manifest["next_segment"]
+            self.next_id = manifest["next_id"]
+            self.segments = [Segment(self.folder, entry["name"], entry["count"], self.mmap)
+                             for entry in manifest["segments"]]
+        self._remove_unpublished()
+
+    def _remove_unpublished(self):
+        """Delete files left behind by a write or compaction that crashed before publication"""
+        keep = {os.path.basename(path) for segment in self.segments for path in segment.paths}
+        keep.add(os.path.basename(self.manifest_path))
+        cutoff = time.time() - RAG_ORPHAN_GRACE_SECONDS
+        for name in os.listdir(self.folder):
+            if name in keep:
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue  # renamed or published meanwhile
+            if self._delete(path):
+                logging.info(f"Removed unpublished segment file {name} from {self.folder}")
+
+    def _delete(self, path):
+        """Remove a file unless it is still open elsewhere (Windows refuses); returns whether it is gone"""
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            return True
+        except OSError as e:
+            logging.warning(f"Could not delete segment file {path} yet, retrying later: {e}")
+            return False
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def ntotal(self):
+        """Vectors across all segments, including those of deleted chunks"""
+        return sum(segment.count for segment in self.segments)
+
+    def _publish(self, segments, next_id):
+        self.generation += 1
+        manifest = {
+            "generation": self.generation,
+            "next_segment": self.next_segment,
+            "next_id": next_id,
+            "segments": [{"name": segment.name, "count": segment.count} for segment in segments],
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self.segments = segments
+        self.next_id = next_id
+
+    def _new_name(self):
+        name = f"seg-{self.next_segment:06d}"
+        self.next_segment += 1
+        return name
+
+    def write(self, vectors, ids, texts):
+        """Write a new, not yet published segment holding ids"""
+        return Segment.write(self.folder, self._new_name(), vectors, ids, texts, self.mmap)
+
+    def publish(self, added=(), removed=()):
+        """Atomically switch to the current segments plus added minus removed, then delete removed files"""
+        segments = [segment for segment in self.segments if segment not in removed] + list(added)
+        next_id = max([self.next_id] + [int(np.max(segment.ids)) + 1 for segment in added if segment.count])
+        self._publish(segments, next_id)
+        # Release our own mappings first; files another process still maps are retried on the next publish
+        for segment in removed:
+            segment.close()
+        paths = self._retired + [path for segment in removed for path in segment.paths]
+        self._retired = [path for path in paths if not self._delete(path)]
+
+    def adopt(self, index_path, ids, texts):
+        """Turn a legacy single faiss_index.bin into the first segment"""
+        name = self._new_name()
+        segment = Segment(self.folder, name, read_index(index_path, mmap=True).ntotal, self.mmap)
+        keywords = BM25Index(segment.keywords_path)
+        keywords.add(ids, texts)
+        keywords.save()
+        np.save(segment.ids_path, np.asarray(ids, dtype='int64'))
+        # Link rather than move, so the legacy file survives until the manifest references its copy
+        os.link(index_path, segment.index_path)
+        self._publish(self.segments + [segment], max([self.next_id] + [int(i) + 1 for i in ids]))
+        os.remove(index_path)
+
+    def clear(self):
+        old_segments = self.segments
+        self.next_id = 0
+        self.publish(removed=old_segments)
+
+    def search(self, query_vector, k):
+        """Search every segment and merge into one list of IDs ordered by distance"""
+        distances, ids = [], []
+        for segment in self.segments:
+            if not segment.count:
+                continue
+            D, I = segment.index.search(query_vector, min(k, segment.count))
+            distances.append(D[0])
+            ids.append(I[0])
+        if not ids:
+            return []
+        distances = np.concatenate(distances)
+        ids = np.concatenate(ids)
+        order = np.argsort(distances, kind='stable')
+        return [int(i) for i in ids[order] if i >= 0][:k]
+
+    def keyword_search(self, query, k):
+        return search_indexes([segment.keywords for segment in self.segments], query, k)
+
+    def compressed(self):
+        """Whether any segment stores approximate (quantized) vectors"""
+        return any(segment.storage != "float32" for segment in self.segments)
+
+    def compaction_plan(self, live_mask):
+        """Segments to merge: any whose kind, storage or deleted fraction no longer fits, plus the
+        smallest ones while there are more than RAG_MAX_SEGMENTS"""
+        plan = []
+        for segment in self.segments:
+            live = int(np.count_nonzero(live_mask(segment.ids)))
+            if live == 0 or needs_rebuild(segment.index, live):
+                plan.append(segment)
+        if len(self.segments) > RAG_MAX_SEGMENTS:
+            # Merging n segments into one removes n - 1; bring the count down to half the limit
+            extra = len(self.segments) - RAG_MAX_SEGMENTS // 2 + 1 - len(plan)
+            by_size = sorted((s for s in self.segments if s not in plan), key=lambda s: s.count)
+            plan.extend(by_size[:max(0, extra)])
+        return plan
+
+    def nbytes(self):
+        return sum(segment.nbytes() for segment in self.segments)
+
+    def describe(self):
+        return ", ".join(f"{segment.name}:{describe(segment.index)}x{segment.count}" for segment in self.segments)
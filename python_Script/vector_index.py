@@ -0,0 +1,188 @@
+import os
+import math
+
+import numpy as np
+import faiss
+
+# Index selection by corpus size: exact flat search for small corpora, HNSW for
+# mid-sized ones and IVF (which supports in-place deletes and scales further) beyond that
+RAG_HNSW_THRESHOLD = int(os.getenv("RAG_HNSW_THRESHOLD", "20000"))
+RAG_IVF_THRESHOLD = int(os.getenv("RAG_IVF_THRESHOLD", "200000"))
+
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+
+# Rebuild once this fraction of an index's vectors belong to deleted chunks
+RAG_MAX_DEAD_FRACTION = float(os.getenv("RAG_MAX_DEAD_FRACTION", "0.2"))
+
+INDEX_KINDS = ("flat", "hnsw", "ivf")
+
+# How each index stores its vectors: full float32, float16 (2x smaller), 8-bit scalar
+# quantization (4x) or product quantization with RAG_PQ_M one-byte codes per vector (32x at M=48)
+RAG_INDEX_STORAGE = os.getenv("RAG_INDEX_STORAGE", "float32")
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "48"))
+# Trained modes need enough vectors to fit their codebooks (~39 points per PQ centroid);
+# smaller corpora fall back from pq to sq8 and from sq8 to fp16
+RAG_PQ_MIN_TRAIN = int(os.getenv("RAG_PQ_MIN_TRAIN", "9984"))
+RAG_SQ_MIN_TRAIN = int(os.getenv("RAG_SQ_MIN_TRAIN", "1000"))
+
+STORAGE_MODES = ("float32", "fp16", "sq8", "pq")
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def choose_index_kind(n_chunks):
+    """Pick the index type for a corpus of n_chunks vectors"""
+    if n_chunks >= RAG_IVF_THRESHOLD:
+        return "ivf"
+    if n_chunks >= RAG_HNSW_THRESHOLD:
+        return "hnsw"
+    return "flat"
+
+
+def ivf_nlist(n_chunks):
+    """Number of IVF cells for a corpus, keeping at least ~39 training points per cell"""
+    return max(1, min(int(4 * math.sqrt(n_chunks)), n_chunks // 39))
+
+
+def effective_storage(n_chunks, storage=None):
+    """The storage mode actually used for a corpus of n_chunks vectors"""
+    storage = storage or RAG_INDEX_STORAGE
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown index storage {storage!r}, expected one of {STORAGE_MODES}")
+    if storage == "pq" and n_chunks < RAG_PQ_MIN_TRAIN:
+        storage = "sq8"
+    if storage == "sq8" and n_chunks < RAG_SQ_MIN_TRAIN:
+        storage = "fp16"
+    return storage
+
+
+def index_kind(index):
+    """Return the kind of an index built by build_index"""
+    if isinstance(index, faiss.IndexIVF) or isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        return "ivf"
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_storage(index):
+    """Return the storage mode of an index built by build_index"""
+    if index_kind(index) == "ivf":
+        codes = faiss.downcast_index(faiss.extract_index_ivf(index))
+    else:
+        codes = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if isinstance(codes, faiss.IndexHNSW):
+            codes = faiss.downcast_index(codes.storage)
+    if isinstance(codes, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(codes, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if codes.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "float32"
+
+
+def _training_sample(vectors, size):
+    """Training on a sample keeps retraining cost bounded for very large corpora"""
+    size = min(len(vectors), size)
+    return vectors[np.random.default_rng(0).choice(len(vectors), size, replace=False)]
+
+
+def build_index(kind, vectors, ids, storage=None):
+    """Build an ID-addressable index of the given kind holding vectors under ids"""
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    ids = np.asarray(ids, dtype='int64')
+    dim = vectors.shape[1]
+    storage = effective_storage(len(vectors), storage)
+
+    if kind == "ivf":
+        nlist = ivf_nlist(len(vectors))
+        quantizer = faiss.IndexFlatL2(dim)
+        if storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, RAG_PQ_M, 8)
+        elif storage in _SQ_TYPES:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[storage], faiss.METRIC_L2)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(_training_sample(vectors, nlist * 256))
+        index.add_with_ids(vectors, ids)
+    elif kind == "hnsw":
+        if storage == "pq":
+            inner = faiss.IndexHNSWPQ(dim, RAG_PQ_M, RAG_HNSW_M)
+        elif storage in _SQ_TYPES:
+            inner = faiss.IndexHNSWSQ(dim, _SQ_TYPES[storage], RAG_HNSW_M)
+        else:
+            inner = faiss.IndexHNSWFlat(dim, RAG_HNSW_M)
+        inner.hnsw.efConstruction = RAG_HNSW_EF_CONSTRUCTION
+        if not inner.is_trained:
+            inner.train(_training_sample(vectors, 256 * 256))
+        index = faiss.IndexIDMap2(inner)
+        index.add_with_ids(vectors, ids)
+    else:
+        if storage == "pq":
+            inner = faiss.IndexPQ(dim, RAG_PQ_M, 8)
+        elif storage in _SQ_TYPES:
+            inner = faiss.IndexScalarQuantizer(dim, _SQ_TYPES[storage])
+        else:
+            inner = faiss.IndexFlatL2(dim)
+        if not inner.is_trained:
+            inner.train(_training_sample(vectors, 256 * 256))
+        index = faiss.IndexIDMap2(inner)
+        index.add_with_ids(vectors, ids)
+
+    configure_search(index)
+    return index
+
+
+def configure_search(index):
+    """Apply the search-time parameters, which are not always persisted with the index"""
+    kind = index_kind(index)
+    if kind == "ivf":
+        faiss.extract_index_ivf(index).nprobe = RAG_IVF_NPROBE
+    elif kind == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = RAG_HNSW_EF_SEARCH
+    return index
+
+
+def read_index(path, mmap=False):
+    """Read a saved index; with mmap, vector data stays in the file and the index is read-only"""
+    if not mmap:
+        return configure_search(faiss.read_index(path))
+    with open(path, 'rb') as f:
+        fourcc = f.read(4)
+    # IVF inverted lists are mapped by IO_FLAG_MMAP, flat code arrays (flat, HNSW storage) by IO_FLAG_MMAP_IFC
+    flags = faiss.IO_FLAG_MMAP if fourcc.startswith(b"Iw") else faiss.IO_FLAG_MMAP_IFC
+    return configure_search(faiss.read_index(path, flags | faiss.IO_FLAG_READ_ONLY))
+
+
+def needs_rebuild(index, live_chunks):
+    """Whether an index should be rebuilt for the current number of live chunks"""
+    kind = index_kind(index)
+    current = INDEX_KINDS.index(kind)
+    if INDEX_KINDS.index(choose_index_kind(live_chunks)) > current:
+        return True
+    # Only step down once well below the threshold so deletes around it don't cause rebuild churn
+    if INDEX_KINDS.index(choose_index_kind(live_chunks * 2)) < current:
+        return True
+    if index.ntotal and (index.ntotal - live_chunks) / index.ntotal > RAG_MAX_DEAD_FRACTION:
+        return True
+    # Storage mode changed (RAG_INDEX_STORAGE) or the corpus grew enough to train a smaller code;
+    # like the kind, only fall back to a larger code once well below the training threshold
+    storage = index_storage(index)
+    if storage != effective_storage(live_chunks) and storage != effective_storage(live_chunks * 2):
+        return True
+    # IVF cells were sized for the corpus it was trained on; retrain once it has grown well past that
+    if kind == "ivf" and ivf_nlist(live_chunks) > 2 * faiss.extract_index_ivf(index).nlist:
+        return True
+    return False
+
+
+def describe(index):
+    if index is None:
+        return "none"
+    kind = index_kind(index)
+    if kind == "ivf":
+        kind = f"ivf(nlist={faiss.extract_index_ivf(index).nlist})"
+    return f"{kind}/{index_storage(index)}"
+